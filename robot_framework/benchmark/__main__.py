@@ -0,0 +1,5 @@
+"""The entry point of the OPUS benchmark."""
+import sys
+
+from robot_framework.benchmark import harness
+sys.exit(harness.main())
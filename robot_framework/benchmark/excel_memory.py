@@ -0,0 +1,87 @@
+"""This module contains a peak memory benchmark of reading and processing a submission sheet in initialize.
+
+It writes a synthetic sheet, by default of 100,000 rows with a wide unused column, and processes it
+once loaded whole with load_excel_data and once streamed in chunks with scan_excel and iter_excel_chunks.
+The peak memory allocated by Python and the time of each is reported.
+
+Run it with: python -m robot_framework.benchmark.excel_memory --rows 100000 --chunk-size 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.fernet import Fernet
+
+from robot_framework import config, initialize
+from robot_framework.benchmark.synthetic import synthetic_sheet
+from robot_framework.subprocesses.cpr_encryption import encryption_pool
+
+FILENAME = "benchmark.xlsx"
+
+
+def process_loaded() -> int:
+    """Process the sheet loaded whole, like initialize does when EXCEL_CHUNK_SIZE is None, and return the number of rows."""
+    data_df = initialize.load_excel_data(FILENAME)
+    with encryption_pool(len(data_df)) as pool:
+        return len(initialize.process_data(data_df, "benchmark", FILENAME, pool))
+
+
+def process_streamed(chunk_size: int) -> int:
+    """Process the sheet streamed in chunks, like initialize does when EXCEL_CHUNK_SIZE is set, and return the number of rows."""
+    row_count, column_types = initialize.scan_excel(FILENAME, chunk_size)
+    processed = 0
+    with encryption_pool(row_count) as pool:
+        for data_df in initialize.iter_excel_chunks(FILENAME, chunk_size, column_types):
+            processed += len(initialize.process_data(data_df, "benchmark", FILENAME, pool))
+    return processed
+
+
+def measure(function, *args) -> tuple[int, float, float]:
+    """Run function and return its number of rows, its peak memory in MB above the memory in use before it, and its seconds."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        rows = function(*args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return rows, peak / 1e6, elapsed
+
+
+def main(args=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the peak memory of loading versus streaming a submission sheet.")
+    parser.add_argument("--rows", type=int, default=100000, help="The number of rows of the sheet.")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="The rows per chunk when streaming.")
+    parser.add_argument("--blob-size", type=int, default=500, help="The characters per row of the unused column.")
+    args = parser.parse_args(args)
+
+    if "OpenOrchestratorKey" not in os.environ:
+        os.environ["OpenOrchestratorKey"] = Fernet.generate_key().decode("utf-8")
+
+    saved_path = config.PATH
+    with tempfile.TemporaryDirectory() as path:
+        config.PATH = path
+        try:
+            print(f"Writing a sheet of {args.rows} rows...")
+            synthetic_sheet(args.rows, blob_size=args.blob_size).to_excel(os.path.join(path, FILENAME), index=False)
+
+            results = {
+                "read_excel": measure(process_loaded),
+                f"streamed ({args.chunk_size} rows per chunk)": measure(process_streamed, args.chunk_size),
+            }
+        finally:
+            config.PATH = saved_path
+
+    print()
+    print(f"{'Reader':<40}{'rows':>10}{'peak MB':>10}{'seconds':>10}")
+    for name, (rows, peak, elapsed) in results.items():
+        print(f"{name:<40}{rows:>10}{peak:>10.0f}{elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
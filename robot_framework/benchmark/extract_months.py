@@ -0,0 +1,77 @@
+"""This module contains a microbenchmark of initialize.extract_months_and_year.
+
+It reports the rows per second of the current parser and of the implementation it replaced,
+which is kept here as extract_months_and_year_before, on the 'test' column of a synthetic sheet.
+
+Run it with: python -m robot_framework.benchmark.extract_months --rows 20000
+"""
+import argparse
+import ast
+import time
+from datetime import datetime
+
+from robot_framework import initialize
+from robot_framework.benchmark.synthetic import synthetic_sheet
+
+MONTH_MAP = {
+    "January": "Januar",
+    "February": "Februar",
+    "March": "Marts",
+    "April": "April",
+    "May": "Maj",
+    "June": "Juni",
+    "July": "Juli",
+    "August": "August",
+    "September": "September",
+    "October": "Oktober",
+    "November": "November",
+    "December": "December",
+}
+
+
+def extract_months_and_year_before(test_str):
+    """The implementation before the regex parser: evaluate the list and format each date with %B."""
+    data = ast.literal_eval(test_str)
+    months = set()
+    year = None
+
+    for entry in data:
+        if isinstance(entry, dict) and "dato" in entry:
+            date_obj = datetime.strptime(entry["dato"], "%Y-%m-%d")
+            month_name = date_obj.strftime("%B")
+            months.add(MONTH_MAP.get(month_name, month_name))
+            year = date_obj.year
+
+    sorted_months = sorted(months, key=lambda x: list(MONTH_MAP.values()).index(x))
+    return f"{'/'.join(sorted_months)} {year}"
+
+
+def rows_per_second(function, test_strings: list[str]) -> float:
+    """Return the rows per second function parses, on its best of three runs."""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for test_str in test_strings:
+            function(test_str)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(test_strings) / best
+
+
+def main(args=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark extract_months_and_year before and after the regex parser.")
+    parser.add_argument("--rows", type=int, default=20000, help="The number of rows to parse.")
+    args = parser.parse_args(args)
+
+    test_strings = synthetic_sheet(args.rows)["test"].tolist()
+    if [extract_months_and_year_before(s) for s in test_strings] != [initialize.extract_months_and_year(s) for s in test_strings]:
+        raise RuntimeError("The parsers disagree.")
+
+    before = rows_per_second(extract_months_and_year_before, test_strings)
+    after = rows_per_second(initialize.extract_months_and_year, test_strings)
+    print(f"extract_months_and_year on {args.rows} rows: {before:,.0f} rows/s before, {after:,.0f} rows/s after ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""This module contains a benchmark of the OPUS flow of the robot against the offline replica.
+
+It starts an OpusReplica, logs in a browser through initialize_browser, restores the saved session in a
+second browser, and runs handle_opus on generated queue elements. The time of each step of handle_opus,
+of each element and of each wait is reported.
+
+Run it with: python -m robot_framework.benchmark --elements 20 --latency 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from cryptography.fernet import Fernet
+
+from robot_framework import config
+from robot_framework.benchmark.opus_replica import OpusReplica
+from robot_framework.exceptions import BusinessError
+from robot_framework.subprocesses import outlay_ticket_creation
+from robot_framework.subprocesses.cpr_encryption import get_encryptor
+
+STEPS = ("open_form", "fill_form", "upload_attachment", "complete_form_and_submit")
+
+# The smallest file the receipt checks accept
+_RECEIPT = b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+
+
+class BenchmarkConnection:
+    """Stands in for the OrchestratorConnection, keeping the log."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.log = []
+
+    def log_trace(self, message):
+        """Keep a trace message."""
+        self._log("trace", message)
+
+    def log_info(self, message):
+        """Keep an info message."""
+        self._log("info", message)
+
+    def log_error(self, message):
+        """Keep an error message."""
+        self._log("error", message)
+
+    def _log(self, level, message):
+        self.log.append((level, message))
+        if self.verbose:
+            print(f"{level}: {message}")
+
+
+def create_queue_elements(count, path, invalid_every=0) -> list:
+    """Create queue elements with encrypted CPR numbers and their receipts in path.
+
+    Args:
+        invalid_every (optional): Give every nth element a CPR number OPUS rejects, 0 for none.
+    """
+    encryptor = get_encryptor()
+    queue_elements = []
+    for i in range(1, count + 1):
+        cpr = "12345" if invalid_every and i % invalid_every == 0 else f"{i:010d}"
+        element_data = {
+            "uuid": f"benchmark-{i}",
+            "cpr_encrypted": encryptor.encrypt(cpr).decode("utf-8"),
+            "barnets_navn": f"Barn {i}",
+            "beloeb": f"{100 + i},50",
+            "reference": "Januar 2025",
+            "arts_konto": "40430002",
+            "psp": config.PSP_FREETEXT_SCHOOL,
+            "posteringstekst": "Egenbefordring Januar 2025",
+            "naeste_agent": "az00000",
+            "evt_kommentar": "nan",
+        }
+        with open(os.path.join(path, f'receipt_{element_data["uuid"]}.pdf'), "wb") as f:
+            f.write(_RECEIPT)
+        queue_elements.append(SimpleNamespace(reference=element_data["uuid"], data=json.dumps(element_data)))
+    return queue_elements
+
+
+def run_benchmark(elements=10, latency=0.2, profile="performance", invalid_every=0, verbose=False) -> dict:
+    """Run the OPUS flow against a replica and return the timings.
+
+    Returns:
+        dict: The seconds of the login and the session restore, and per element its total, steps, waits and outcome.
+    """
+    if "OpenOrchestratorKey" not in os.environ:
+        os.environ["OpenOrchestratorKey"] = Fernet.generate_key().decode("utf-8")
+    results = {"login": None, "restore": None, "elements": []}
+    connection = BenchmarkConnection(verbose)
+
+    with tempfile.TemporaryDirectory() as path, OpusReplica(latency) as replica, _patched(replica, path, profile) as recorder:
+        queue_elements = create_queue_elements(elements, path, invalid_every)
+
+        start = time.perf_counter()
+        outlay_ticket_creation.initialize_browser("benchmark", "benchmark", profile).quit()
+        results["login"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        browser = outlay_ticket_creation.initialize_browser("benchmark", "benchmark", profile)
+        results["restore"] = time.perf_counter() - start
+
+        try:
+            for queue_element in queue_elements:
+                recorder.steps, recorder.waits = {}, []
+                outcome = "created"
+                start = time.perf_counter()
+                try:
+                    outlay_ticket_creation.handle_opus(queue_element, path, browser, connection)
+                except BusinessError as e:
+                    outcome = f"business error: {e}"
+                results["elements"].append({
+                    "reference": queue_element.reference,
+                    "total": time.perf_counter() - start,
+                    "steps": recorder.steps,
+                    "waits": recorder.waits,
+                    "outcome": outcome,
+                })
+        finally:
+            browser.quit()
+
+        results["tickets"] = len(replica.tickets)
+    return results
+
+
+class _Recorder:
+    """Replaces the steps of handle_opus and log_waits in outlay_ticket_creation with versions that record their timings."""
+
+    def __init__(self):
+        self.steps = {}
+        self.waits = []
+        self._originals = {}
+
+    def install(self):
+        """Replace the functions."""
+        for name in STEPS:
+            self._originals[name] = getattr(outlay_ticket_creation, name)
+            setattr(outlay_ticket_creation, name, self._timed(name, self._originals[name]))
+        self._originals["log_waits"] = outlay_ticket_creation.log_waits
+        outlay_ticket_creation.log_waits = self._log_waits
+
+    def uninstall(self):
+        """Restore the functions."""
+        for name, function in self._originals.items():
+            setattr(outlay_ticket_creation, name, function)
+
+    def _timed(self, name, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.steps[name] = time.perf_counter() - start
+        return timed
+
+    def _log_waits(self, orchestrator_connection, waits, elapsed):
+        self.waits = waits
+        self._originals["log_waits"](orchestrator_connection, waits, elapsed)
+
+
+@contextmanager
+def _patched(replica, path, profile):
+    """Point the robot at the replica and keep its session and browser cache in path, while recording the timings."""
+    saved_url = outlay_ticket_creation.OPUS_PORTAL_URL
+    saved_config = {name: getattr(config, name) for name in ("OPUS_SESSION_PATH", "BROWSER_CACHE_PATH", "BROWSER_PROFILE")}
+    outlay_ticket_creation.OPUS_PORTAL_URL = replica.portal_url
+    config.OPUS_SESSION_PATH = os.path.join(path, "session")
+    config.BROWSER_CACHE_PATH = os.path.join(path, "browser_cache")
+    config.BROWSER_PROFILE = profile
+    recorder = _Recorder()
+    recorder.install()
+    try:
+        yield recorder
+    finally:
+        recorder.uninstall()
+        outlay_ticket_creation.OPUS_PORTAL_URL = saved_url
+        for name, value in saved_config.items():
+            setattr(config, name, value)
+
+
+def report(results: dict, latency: float, profile: str):
+    """Print the timings of a benchmark run."""
+    element_results = results["elements"]
+    print(f"OPUS replica benchmark: {len(element_results)} elements, {latency:.2f}s latency, {profile} browser profile")
+    print(f"Login {results['login']:.2f}s, session restore {results['restore']:.2f}s, {results['tickets']} tickets created")
+    if not element_results:
+        return
+
+    print()
+    print(f"{'Step':<40}{'mean':>8}{'median':>8}{'max':>8}")
+    for name in STEPS + ("total",):
+        durations = [result["steps"][name] if name != "total" else result["total"]
+                     for result in element_results if name == "total" or name in result["steps"]]
+        if durations:
+            print(f"{name:<40}{statistics.mean(durations):>8.2f}{statistics.median(durations):>8.2f}{max(durations):>8.2f}")
+
+    waits = {}
+    for result in element_results:
+        for name, duration in result["waits"]:
+            waits.setdefault(name, []).append(duration)
+    print()
+    print(f"{'Wait':<40}{'count':>8}{'mean':>8}{'total':>8}")
+    for name, durations in sorted(waits.items(), key=lambda wait: sum(wait[1]), reverse=True):
+        print(f"{name[:39]:<40}{len(durations):>8}{statistics.mean(durations):>8.2f}{sum(durations):>8.2f}")
+
+    print()
+    print(f"{'Element':<40}{'total':>8}  outcome")
+    for result in element_results:
+        print(f"{result['reference']:<40}{result['total']:>8.2f}  {result['outcome']}")
+
+
+def main(args=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the OPUS flow of the robot against an offline replica of OPUS.")
+    parser.add_argument("--elements", type=int, default=10, help="The number of queue elements to create tickets for.")
+    parser.add_argument("--latency", type=float, default=0.2, help="The seconds the replica takes to answer each request.")
+    parser.add_argument("--profile", choices=("default", "performance"), default="performance", help="The browser profile, see initialize_browser.")
+    parser.add_argument("--invalid-every", type=int, default=0, help="Give every nth element a CPR number OPUS rejects.")
+    parser.add_argument("--json", help="Also write the timings to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Print the trace log of the robot.")
+    args = parser.parse_args(args)
+
+    results = run_benchmark(args.elements, args.latency, args.profile, args.invalid_every, args.verbose)
+    report(results, args.latency, args.profile)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    expected = args.elements - (args.elements // args.invalid_every if args.invalid_every else 0)
+    return 0 if results["tickets"] == expected else 1
@@ -0,0 +1,447 @@
+"""This module contains an offline replica of the OPUS pages the robot works with.
+
+The pages are generated from opus_locators, so every locator of the robot resolves against them:
+the login, the portal navigation, the contentAreaFrame/ivuFrm_page0ivu0 form frames and the
+URLSPW-0 popups. Hent, Kontroller and Opret make a round trip to the replica, which answers after
+the configured latency with the same success and error texts as OPUS.
+"""
+import html
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from robot_framework.subprocesses.opus_locators import CONTAINERS, FORM_FRAMES, LOCATORS, absolute_xpath
+
+SESSION_COOKIE = "MYSAPSSO2"
+CREDITOR_ERROR = "Kreditoren kunne ikke oprettes automatisk. Det ikke er et SE/CVR eller CPR nummer."
+KONTROL_OK = "Udgiftsbilag er kontrolleret og OK"
+
+# The fields Kontroller requires, as sent by the form page
+REQUIRED_FIELDS = (
+    "kreditor", "creditor", "udbetalingstekst", "posteringstekst", "reference", "beloeb", "naeste_agent",
+    "udbetalingstekst_linjer", "attachment", "posting_art", "posting_beloeb", "posting_psp", "posting_tekst",
+)
+
+_VOID_TAGS = {"input", "br"}
+
+# Shared by all pages. While a round trip is pending, a busy overlay covers the page and keeps
+# the DOM changing, so clicks are intercepted and the DOM-settle waits see the round trip.
+_SCRIPT = """
+function roundTrip(action, payload, then) {
+    var busy = document.createElement('div');
+    busy.className = 'busy';
+    busy.style.cssText = 'position:fixed;top:0;left:0;width:100%;height:100%;z-index:1000';
+    document.body.appendChild(busy);
+    var tick = setInterval(function () { busy.setAttribute('data-tick', Date.now()); }, 100);
+    fetch('/opus/roundtrip/' + action, {
+        method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(payload || {})
+    }).then(function (r) { return r.json(); }).then(function (result) {
+        clearInterval(tick);
+        busy.remove();
+        then(result);
+    });
+}
+function onAction(handlers) {
+    document.addEventListener('click', function (event) {
+        var target = event.target.closest('[data-action]');
+        if (target && handlers[target.getAttribute('data-action')]) {
+            handlers[target.getAttribute('data-action')](target);
+        }
+    });
+}
+function show(selector) { document.querySelector(selector).style.display = ''; }
+"""
+
+_LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Log på</title></head>
+<body><form method="post" action="/irj/portal">
+<input id="logonuidfield" name="j_username" type="text">
+<input id="logonpassfield" name="j_password" type="password">
+<button id="buttonLogon" type="submit">Log på</button>
+</form></body></html>
+"""
+
+_PORTAL_SCRIPT = """
+onAction({
+    min_oekonomi: function () { show('[data-action="bilag_og_fakturaer"]'); },
+    bilag_og_fakturaer: function () { show('[data-action="opret_udgiftsbilag"]'); },
+    opret_udgiftsbilag: function () {
+        // Every click opens a new, empty form
+        var area = document.getElementById('contentArea');
+        area.innerHTML = '';
+        var frame = document.createElement('iframe');
+        frame.id = frame.name = 'contentAreaFrame';
+        frame.src = '/opus/content';
+        frame.style.cssText = 'width:100%;height:1200px;border:0';
+        area.appendChild(frame);
+    }
+});
+"""
+
+_CONTENT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head>
+<body><iframe id="ivuFrm_page0ivu0" name="ivuFrm_page0ivu0" src="/opus/form" style="width:100%;height:1150px;border:0"></iframe></body></html>
+"""
+
+_FORM_SCRIPT = """
+var state = {creditor: false, lines: '', attachment: '', checked: false};
+top.opusForm = window;
+function value(name) { return document.querySelector('[data-field="' + name + '"]').value; }
+function message(text, id) {
+    var div = document.createElement('div');
+    if (id) { div.id = id; }
+    div.textContent = text;
+    document.getElementById('messages').appendChild(div);
+}
+function openPopup(kind) {
+    var frame = top.document.createElement('iframe');
+    frame.id = frame.name = 'URLSPW-0';
+    frame.src = '/opus/popup/' + kind;
+    frame.style.cssText = 'position:fixed;top:100px;left:100px;width:800px;height:500px;z-index:2000;background:#fff';
+    top.document.body.appendChild(frame);
+}
+function popupClosed(kind, text) {
+    state[kind] = text;
+    document.getElementById(kind).textContent = text;
+}
+function payload() {
+    var data = {creditor: state.creditor, udbetalingstekst_linjer: state.lines, attachment: state.attachment};
+    document.querySelectorAll('[data-field]').forEach(function (field) {
+        data[field.getAttribute('data-field')] = field.value;
+    });
+    return data;
+}
+onAction({
+    hent: function () {
+        roundTrip('hent', {kreditor: value('kreditor')}, function (result) {
+            state.creditor = result.ok;
+            message(result.text, result.ok ? null : 'WD0324');
+        });
+    },
+    lines: function () { openPopup('lines'); },
+    attach: function () { openPopup('attachment'); },
+    artskonto: function () { document.querySelector('[data-field="posting_art"]').focus(); },
+    kontroller: function () {
+        roundTrip('kontroller', payload(), function (result) {
+            state.checked = result.ok;
+            message(result.text);
+        });
+    },
+    opret: function () {
+        var data = payload();
+        data.checked = state.checked;
+        roundTrip('opret', data, function (result) { message(result.text); });
+    }
+});
+"""
+
+_LINES_POPUP = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><script>{script}</script></head>
+<body>
+<textarea id="lines" rows="5"></textarea>
+<div class="lsButton" data-action="gem">Gem</div>
+<div class="lsButton" data-action="annuller">Annuller</div>
+<script>
+window.focus();
+document.getElementById('lines').focus();
+onAction({{
+    gem: function () {{
+        top.opusForm.popupClosed('lines', document.getElementById('lines').value);
+        top.document.getElementById('URLSPW-0').remove();
+    }},
+    annuller: function () {{ top.document.getElementById('URLSPW-0').remove(); }}
+}});
+</script>
+</body></html>
+"""
+
+_ATTACHMENT_SCRIPT = """
+var fileInput = document.querySelector('input[type=file]');
+fileInput.addEventListener('change', function () {
+    // The file is uploaded when it is selected
+    roundTrip('upload', {name: fileInput.files[0].name}, function (result) {
+        document.getElementById('selected').textContent = result.text;
+    });
+});
+onAction({
+    ok: function () {
+        if (!fileInput.files.length) {
+            document.getElementById('selected').textContent = 'Vælg en fil';
+            return;
+        }
+        top.opusForm.popupClosed('attachment', fileInput.files[0].name);
+        top.document.getElementById('URLSPW-0').remove();
+    }
+});
+"""
+
+
+class _Element:
+    """An HTML element of a generated page."""
+
+    def __init__(self, tag, attrs=None, text=""):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.text = text
+        self.children = []
+
+    def child(self, step):
+        """Return the child of an XPath step like "div" or "div[3]", adding it and the siblings before it if needed."""
+        match = re.fullmatch(r"([a-z0-9]+)(?:\[(\d+)\])?", step)
+        if match is None:
+            raise ValueError(f"Unsupported XPath step: {step}")
+        tag, position = match.group(1), int(match.group(2) or 1)
+        same_tag = [child for child in self.children if child.tag == tag]
+        while len(same_tag) < position:
+            same_tag.append(_Element(tag))
+            self.children.append(same_tag[-1])
+        return same_tag[position - 1]
+
+    def render(self) -> str:
+        """Return the element as HTML."""
+        attrs = "".join(f' {name}="{html.escape(str(value))}"' for name, value in self.attrs.items())
+        if self.tag in _VOID_TAGS:
+            return f"<{self.tag}{attrs}>"
+        children = "".join(child.render() for child in self.children)
+        return f"<{self.tag}{attrs}>{html.escape(self.text)}{children}</{self.tag}>"
+
+
+def build_body(elements: dict[str, dict]) -> _Element:
+    """Build a body where each absolute XPath of elements, from /html/body, selects an element with the given attributes.
+
+    The key "text" of the attributes is the text of the element. A final "//tag[@...]" step adds the element
+    directly below the path before it.
+    """
+    body = _Element("body")
+    for xpath, attrs in elements.items():
+        path, _, descendant = xpath.partition("//")
+        if not path.startswith("/html/body/"):
+            raise ValueError(f"Not an absolute XPath in the body: {xpath}")
+
+        element = body
+        for step in path[len("/html/body/"):].split("/"):
+            element = element.child(step)
+        if descendant:
+            element.children.append(_Element(re.sub(r"\[.*\]$", "", descendant)))
+            element = element.children[-1]
+
+        attrs = dict(attrs)
+        element.text = attrs.pop("text", "")
+        element.attrs.update(attrs)
+    return body
+
+
+def _page(body: _Element, script: str) -> str:
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+        f"<script>{_SCRIPT}</script></head>{body.render()[:-len('</body>')]}"
+        f"<script>{script}</script></body></html>\n"
+    )
+
+
+def portal_page() -> str:
+    """Return the portal with the navigation to a new outlay ticket."""
+    opret = absolute_xpath("opret_udgiftsbilag")
+    menu = opret.split("/div[9]/")[0]
+    body = build_body({
+        f"{menu}/div[1]": {"text": "Min Økonomi", "data-action": "min_oekonomi"},
+        f"{menu}/div[2]": {"text": "Bilag og fakturaer", "data-action": "bilag_og_fakturaer", "style": "display:none"},
+        opret: {"text": "Opret udgiftsbilag", "data-action": "opret_udgiftsbilag", "style": "display:none"},
+        "/html/body/div[2]": {"id": "contentArea"},
+    })
+    return _page(body, _PORTAL_SCRIPT)
+
+
+def form_page() -> str:
+    """Return an empty outlay ticket form."""
+    fields = {
+        name: {"data-field": name, "type": "text"}
+        for name in ("kreditor", "udbetalingstekst", "posteringstekst", "reference", "beloeb", "naeste_agent")
+    }
+    fields["kommentar"] = {"data-field": "kommentar"}
+    buttons = {
+        "hent": ("Hent", "hent"),
+        "udbetalingstekst_linjer": ("Linjer", "lines"),
+        "vedhaeft_nyt": ("Vedhæft nyt", "attach"),
+        "artskonto": ("Artskonto", "artskonto"),
+        "kontroller": ("Kontroller", "kontroller"),
+        "opret": ("Opret", "opret"),
+    }
+    elements = {absolute_xpath(name): attrs for name, attrs in fields.items()}
+    elements.update({absolute_xpath(name): {"text": text, "data-action": action} for name, (text, action) in buttons.items()})
+    missing = [name for name, locator in LOCATORS.items() if locator.frames == FORM_FRAMES and name not in fields and name not in buttons]
+    if missing:
+        raise ValueError(f"The replica has no element for the form locators: {', '.join(missing)}")
+
+    body = build_body(elements)
+    # The posting line cells are reached by tabbing from Artskonto
+    posting = _Element("div")
+    for name in ("posting_art", "posting_beloeb", "posting_x1", "posting_x2", "posting_psp", "posting_tekst"):
+        posting.children.append(_Element("input", {"data-field": name, "type": "text"}))
+    body.children.append(posting)
+    for state_id in ("lines", "attachment"):
+        body.children.append(_Element("span", {"id": state_id}))
+    body.children.append(_Element("div", {"id": "messages"}))
+    return _page(body, _FORM_SCRIPT)
+
+
+def attachment_popup() -> str:
+    """Return the popup for attaching a file."""
+    body = build_body({
+        absolute_xpath("vaelg_fil_input"): {"type": "file", "name": "file"},
+        absolute_xpath("popup_ok"): {"text": "OK", "data-action": "ok"},
+        f"{CONTAINERS['popup'].xpath}/div[1]": {"id": "selected"},
+    })
+    return _page(body, _ATTACHMENT_SCRIPT)
+
+
+class OpusReplica:
+    """A local HTTP server with the OPUS pages, answering every request after latency seconds.
+
+    The tickets created on it are kept in tickets, in the order they were created.
+    """
+
+    def __init__(self, latency=0.2, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.tickets = []
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.replica = self
+
+        self.pages = {
+            "/opus/content": _CONTENT_PAGE,
+            "/opus/form": form_page(),
+            "/opus/popup/lines": _LINES_POPUP.format(script=_SCRIPT),
+            "/opus/popup/attachment": attachment_popup(),
+        }
+        self.portal = portal_page()
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def portal_url(self) -> str:
+        """The URL to use instead of outlay_ticket_creation.OPUS_PORTAL_URL."""
+        return f"{self.url}/irj/portal"
+
+    def start(self) -> "OpusReplica":
+        """Start serving on a background thread."""
+        threading.Thread(target=self._server.serve_forever, name="opus-replica", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def login(self) -> str:
+        """Create a session and return its cookie value."""
+        session = secrets.token_hex(16)
+        with self._lock:
+            self._sessions.add(session)
+        return session
+
+    def is_logged_in(self, session) -> bool:
+        """Check if a cookie value is a session of this server."""
+        return session in self._sessions
+
+    def round_trip(self, action, data) -> dict:
+        """Answer a round trip from a page, like OPUS does."""
+        if action == "hent":
+            kreditor = data.get("kreditor", "")
+            found = re.fullmatch(r"\d{10}", kreditor) is not None
+            return {"ok": found, "text": f"Kreditor {kreditor[:6]}-xxxx" if found else CREDITOR_ERROR}
+
+        if action == "upload":
+            return {"ok": True, "text": f"{data.get('name')} er uploadet"}
+
+        if action not in ("kontroller", "opret"):
+            return {"ok": False, "text": f"Ukendt handling: {action}"}
+
+        missing = [name for name in REQUIRED_FIELDS if not data.get(name)]
+        if missing:
+            return {"ok": False, "text": f"Fejl: {', '.join(missing)} mangler"}
+        if action == "kontroller":
+            return {"ok": True, "text": KONTROL_OK}
+        return self._create_ticket(data)
+
+    def _create_ticket(self, data) -> dict:
+        if not data.get("checked"):
+            return {"ok": False, "text": "Fejl: Udgiftsbilaget skal kontrolleres først"}
+        with self._lock:
+            self.tickets.append(data)
+            number = 1900000000 + len(self.tickets)
+        return {"ok": True, "text": f"Udgiftsbilag {number} er oprettet"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the pages of the OpusReplica of the server."""
+
+    @property
+    def replica(self) -> OpusReplica:
+        """The replica this request is for."""
+        return self.server.replica
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve a page, or the login if there is no session."""
+        time.sleep(self.replica.latency)
+        path = self.path.split("?")[0]
+        if path == "/irj/portal":
+            self._send(200, self.replica.portal if self._logged_in() else _LOGIN_PAGE)
+        elif path in self.replica.pages and self._logged_in():
+            self._send(200, self.replica.pages[path])
+        else:
+            self._send(404, "Not found")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Log in, or answer a round trip."""
+        time.sleep(self.replica.latency)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+
+        if self.path == "/irj/portal":
+            form = parse_qs(body)
+            if not (form.get("j_username") and form.get("j_password")):
+                self._send(200, _LOGIN_PAGE)
+                return
+            self.send_response(303)
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={self.replica.login()}; Path=/")
+            self.send_header("Location", "/irj/portal")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.startswith("/opus/roundtrip/") and self._logged_in():
+            result = self.replica.round_trip(self.path.rsplit("/", 1)[1], json.loads(body or "{}"))
+            self._send(200, json.dumps(result), "application/json")
+        else:
+            self._send(404, "Not found")
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Requests are not logged."""
+
+    def _logged_in(self) -> bool:
+        cookies = dict(
+            cookie.strip().split("=", 1) for cookie in self.headers.get("Cookie", "").split(";") if "=" in cookie
+        )
+        return self.replica.is_logged_in(cookies.get(SESSION_COOKIE))
+
+    def _send(self, status, text, content_type="text/html"):
+        content = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
@@ -0,0 +1,75 @@
+"""This module contains a benchmark of writing the statuses of the status journal to the Excel sheet.
+
+It reports the time per element of helper_functions.StatusTable and of update_dataframe, the function it
+replaced, which is kept here as update_dataframe_before, on sheets of 1,000, 10,000 and 100,000 rows.
+
+Run it with: python -m robot_framework.benchmark.status_table --statuses 200
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from robot_framework.subprocesses.helper_functions import StatusTable, ensure_columns
+
+SHEET_ROWS = (1000, 10000, 100000)
+
+
+def update_dataframe_before(df: pd.DataFrame, uuid, failed):
+    """The implementation before StatusTable: select the rows of the element by scanning the uuid column."""
+    df.loc[df['uuid'] == uuid, 'behandlet_fejl' if failed else 'behandlet_ok'] = 'x'
+    if not failed:
+        df.loc[df['uuid'] == uuid, 'behandlet_fejl'] = ' '
+    else:
+        df.loc[df['uuid'] == uuid, 'behandlet_ok'] = ' '
+
+
+def status_sheet(rows: int) -> pd.DataFrame:
+    """Return a sheet of rows rows with a uuid column, some uuids on two rows, and a column of other data."""
+    return pd.DataFrame({
+        "uuid": [f"form-{i // 2 if i % 10 == 0 else i}" for i in range(rows)],
+        "barnets_navn": [f"Barn {i}" for i in range(rows)],
+    })
+
+
+def measure(rows: int, statuses: dict) -> tuple[float, float, float]:
+    """Set the statuses in a sheet of rows rows with both implementations, checking that the sheets are equal.
+
+    Returns:
+        tuple[float, float, float]: The seconds per element before and after, and the seconds to build the StatusTable.
+    """
+    df_before = ensure_columns(status_sheet(rows))
+    start = time.perf_counter()
+    for uuid, failed in statuses.items():
+        update_dataframe_before(df_before, uuid, failed)
+    before = (time.perf_counter() - start) / len(statuses)
+
+    start = time.perf_counter()
+    status_table = StatusTable(status_sheet(rows))
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    status_table.apply(statuses)
+    after = (time.perf_counter() - start) / len(statuses)
+
+    pd.testing.assert_frame_equal(status_table.to_dataframe(), df_before)
+    return before, after, build
+
+
+def main(args=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark setting the statuses of the Excel sheet before and after StatusTable.")
+    parser.add_argument("--statuses", type=int, default=200, help="The number of element statuses to set per sheet.")
+    args = parser.parse_args(args)
+
+    rng = random.Random(0)
+    print(f"Time per element, setting {args.statuses} statuses:")
+    print(f"{'Rows':>10}{'before':>12}{'after':>12}{'index build':>14}")
+    for rows in SHEET_ROWS:
+        statuses = {f"form-{rng.randrange(rows)}": rng.random() < 0.2 for _ in range(args.statuses)}
+        before, after, build = measure(rows, statuses)
+        print(f"{rows:>10}{before * 1e6:>10.1f}us{after * 1e6:>10.1f}us{build * 1e3:>12.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
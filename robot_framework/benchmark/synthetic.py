@@ -0,0 +1,54 @@
+"""This module contains synthetic submission sheets for the benchmarks and tests of initialize.
+
+The sheets have the columns process_data uses, with the kinds of values the OS2Forms export holds:
+blanks, numbers stored as text, mixed types and the serialized 'test' list of driving dates.
+"""
+import random
+
+import pandas as pd
+
+SCHOOLS = (
+    "Langagerskolen", "751090#1830 Langagerskolen", "Stensagerskolen", "751903#2521",
+    "Anden skole", None, "stensagerskolen og langagerskolen",
+)
+
+
+def driving_dates(rng: random.Random) -> str:
+    """Return a serialized list of driving dates like the 'test' column."""
+    year = rng.choice((2023, 2024))
+    dates = [
+        {"dato": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "km": rng.randint(1, 30)}
+        for _ in range(rng.randint(1, 4))
+    ]
+    return str(dates + [{"total": sum(date["km"] for date in dates)}])
+
+
+def synthetic_sheet(rows: int, seed: int = 0, blob_size: int = 0) -> pd.DataFrame:
+    """Return a submission sheet of rows rows.
+
+    Args:
+        seed (optional): The seed of the random values, so a sheet can be created again.
+        blob_size (optional): Add a wide column of this many characters per row, like the unused columns of the export.
+    """
+    rng = random.Random(seed)
+    sheet = pd.DataFrame({
+        "uuid": [f"form-{seed}-{i}" for i in range(rows)],
+        "test": [driving_dates(rng) for _ in range(rows)],
+        "cpr_nr": [rng.choice((1234567890, 101010101, 2411951234)) for _ in range(rows)],
+        "cpr_nr_paaanden": [rng.choice((None, None, "0101011234", 2222222222.0)) for _ in range(rows)],
+        "attachments": [
+            rng.choice((f"{{'url': 'https://os2forms.example/receipt/{i}'}}", "ingen", None, "https://uden-slut"))
+            for i in range(rows)
+        ],
+        "skoleliste": [rng.choice(SCHOOLS) for _ in range(rows)],
+        "skriv_dit_barns_skole_eller_dagtilbud": [rng.choice((None, None, "Friskolen")) for _ in range(rows)],
+        "barnets_navn": [rng.choice(("Anna", "Bo Ærø", None, 5)) for _ in range(rows)],
+        "aendret_beloeb_i_alt": [rng.choice((None, None, 12.5, "1.234.56", 100)) for _ in range(rows)],
+        "beloeb_i_alt": [rng.choice((None, 99.75, "1.000,50", 7)) for _ in range(rows)],
+        "godkendt": [rng.choice(("x", "X", None, "", "nej")) for _ in range(rows)],
+        "godkendt_af": [rng.choice((None, "az12345")) for _ in range(rows)],
+        "evt_kommentar": [rng.choice((None, "Kommentar", 3)) for _ in range(rows)],
+    })
+    if blob_size:
+        sheet["data"] = ["x" * blob_size] * rows
+    return sheet
@@ -0,0 +1,66 @@
+"""This module contains a caching wrapper around the connection to OpenOrchestrator."""
+
+import threading
+import time
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+
+
+class CachedOrchestratorConnection:
+    """Wraps an OrchestratorConnection and caches constants and credentials.
+
+    Each value is kept for the TTL configured for its name in config.ORCHESTRATOR_CACHE_TTL_OVERRIDES,
+    or config.ORCHESTRATOR_CACHE_TTL. Everything else is passed through to the wrapped connection.
+    """
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection):
+        self._connection = orchestrator_connection
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def get_constant(self, constant_name: str):
+        """Get a constant from OpenOrchestrator, using the cache if the value is fresh."""
+        return self._get_cached("constant", constant_name, self._connection.get_constant)
+
+    def get_credential(self, credential_name: str):
+        """Get a credential from OpenOrchestrator, using the cache if the value is fresh."""
+        return self._get_cached("credential", credential_name, self._connection.get_credential)
+
+    def invalidate(self, name: str | None = None) -> None:
+        """Remove a constant or credential from the cache, e.g. after an authentication failure.
+        If no name is given the whole cache is cleared.
+        """
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(("constant", name), None)
+                self._cache.pop(("credential", name), None)
+
+    def _get_cached(self, kind: str, name: str, fetch):
+        key = (kind, name)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        value = fetch(name)
+        ttl = config.ORCHESTRATOR_CACHE_TTL_OVERRIDES.get(name, config.ORCHESTRATOR_CACHE_TTL)
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, value)
+        return value
+
+
+def invalidate(orchestrator_connection, name: str) -> None:
+    """Remove a constant or credential from the cache of the connection, if it is a CachedOrchestratorConnection."""
+    if isinstance(orchestrator_connection, CachedOrchestratorConnection):
+        orchestrator_connection.invalidate(name)
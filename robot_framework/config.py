@@ -15,6 +15,11 @@ SCREENSHOT_SENDER = "robot@friend.dk"
 
 # Constant/Credential names
 ERROR_EMAIL = "Error Email"
+OS2_API_CREDENTIAL = "os2_api"
+
+# Seconds a constant or credential fetched from OpenOrchestrator is cached, with per-name overrides
+ORCHESTRATOR_CACHE_TTL = 900
+ORCHESTRATOR_CACHE_TTL_OVERRIDES = {}
 
 SERVICE_NOW_API_DEV_USER = "service_now_dev_user"
 SERVICE_NOW_API_PROD_USER = "service_now_prod_user"
@@ -33,6 +38,39 @@ DOCUMENT_LIBRARY = "Delte dokumenter"
 DOCUMENT_FOLDER = "General/Til udbetaling"
 PATH = "C:\\tmp\\Koerselsgodtgoerelse"
 
+# Downloaded SharePoint files are kept here between runs, so unchanged files are not downloaded again
+DOWNLOAD_CACHE_PATH = "C:\\tmp\\Koerselsgodtgoerelse_cache"
+SHAREPOINT_DOWNLOAD_WORKERS = 4
+
+# Processing statuses are journaled here, outside PATH, so they survive a crash and the next run.
+# The Excel file is rewritten from the journal every STATUS_CHECKPOINT_INTERVAL statuses (0 = only in finalize).
+STATUS_JOURNAL_PATH = "C:\\tmp\\Koerselsgodtgoerelse_journal"
+STATUS_CHECKPOINT_INTERVAL = 0
+
+# Status updates to the journalizing database are written in the background, in batches of
+# up to STATUS_WRITER_BATCH_SIZE, waiting at most STATUS_WRITER_FLUSH_SECONDS for more updates.
+STATUS_WRITER_BATCH_SIZE = 50
+STATUS_WRITER_FLUSH_SECONDS = 2
+
+# CPR encryption in initialize: sheets below the threshold are encrypted in-process. Larger sheets
+# are split in chunks and encrypted across one process pool, shared by all Excel chunks of the sheet.
+ENCRYPTION_POOL_THRESHOLD = 20000
+ENCRYPTION_CHUNK_SIZE = 1000
+
+# Number of rows streamed from the Excel file at a time in initialize, e.g. 5000 to bound the memory
+# used by very large sheets. Streaming reads the sheet twice to type the columns like pd.read_excel,
+# so it is slower. None loads the whole sheet with pd.read_excel.
+EXCEL_CHUNK_SIZE = None
+
+# PSP rules: the first rule with a pattern found in the lower-cased 'skoleliste' decides the PSP.
+# If no rule matches, PSP_FREETEXT_SCHOOL is used when the school is written in by hand, else PSP_DEFAULT.
+PSP_RULES = (
+    (("langagerskolen", "751090#1830", "751090#2471"), "XG-5240220808-00004"),
+    (("stensagerskolen", "751903#591", "751903#2521"), "XG-5240220808-00005"),
+)
+PSP_FREETEXT_SCHOOL = "XG-5240220808-00006"
+PSP_DEFAULT = "XG-5240220808-00003"
+
 # Queue specific configs
 # ----------------------
 
@@ -42,4 +80,69 @@ QUEUE_NAME = "bur.egenbefordring.main"
 # The limit on how many queue elements to process
 MAX_TASK_COUNT = 100
 
+# The number of workers processing the queue, each with its own logged-in browser.
+# The browsers are driven through WebDriver only, without OS-level keystrokes, so several can run on one host.
+WORKER_COUNT = 1
+
+# The number of queue elements claimed from the queue in one transaction. Set to 1 to claim one at a time.
+# Claimed elements not processed within QUEUE_LEASE_SECONDS can be claimed again by any robot.
+QUEUE_CLAIM_BATCH_SIZE = 5
+QUEUE_LEASE_SECONDS = 3600
+
+# The number of queue elements each worker claims ahead and downloads the receipt for
+# while the browser works on the current element. Set to 0 to download when needed.
+RECEIPT_LOOKAHEAD = 1
+
+# Receipts of the next MAX_TASK_COUNT queue elements are downloaded in bulk after initialize,
+# RECEIPT_DOWNLOAD_CONCURRENCY at a time. Set to 0 to skip the bulk download.
+# Failed downloads are retried RECEIPT_DOWNLOAD_RETRIES times, waiting RECEIPT_DOWNLOAD_BACKOFF * 2^n seconds.
+RECEIPT_DOWNLOAD_CONCURRENCY = 8
+RECEIPT_DOWNLOAD_TIMEOUT = 60
+RECEIPT_DOWNLOAD_RETRIES = 3
+RECEIPT_DOWNLOAD_BACKOFF = 1
+# Receipts are streamed to disk in chunks of this many bytes
+RECEIPT_CHUNK_SIZE = 64 * 1024
+
+# Downloaded receipts are kept here, outside PATH, until their element has been processed, so retries
+# and re-runs don't download them again. Receipts older than RECEIPT_CACHE_MAX_AGE_DAYS are removed,
+# and the least recently used above RECEIPT_CACHE_MAX_BYTES. Set RECEIPT_CACHE_PATH to None to disable.
+RECEIPT_CACHE_PATH = "C:\\tmp\\Koerselsgodtgoerelse_receipts"
+RECEIPT_CACHE_MAX_BYTES = 500 * 1024 * 1024
+RECEIPT_CACHE_MAX_AGE_DAYS = 14
+
+# OPUS waits for a condition, checked every OPUS_POLL_SECONDS, up to a ceiling in seconds.
+# After a round trip to the server the page is settled when its DOM has not changed for OPUS_SETTLE_MS.
+OPUS_POLL_SECONDS = 0.2
+OPUS_SETTLE_MS = 500
+OPUS_SETTLE_TIMEOUT = 10
+OPUS_CLICK_TIMEOUT = 12
+OPUS_RESULT_TIMEOUT = 15
+
+# After an outlay ticket is created, the next form is opened from the portal navigation next to it,
+# instead of loading the portal again. If the empty form does not appear within OPUS_NEW_FORM_TIMEOUT,
+# the robot navigates from the portal.
+OPUS_STAY_ON_FORM = True
+OPUS_NEW_FORM_TIMEOUT = 10
+
+# A logged-in OPUS session is saved here, encrypted with the OpenOrchestrator key, and restored when a
+# browser is started, instead of logging in. Sessions older than OPUS_SESSION_MAX_AGE seconds are not used,
+# and a restored session must show the portal within OPUS_SESSION_PROBE_TIMEOUT. Set to None to always log in.
+OPUS_SESSION_PATH = "C:\\tmp\\Koerselsgodtgoerelse_session"
+OPUS_SESSION_MAX_AGE = 8 * 3600
+OPUS_SESSION_PROBE_TIMEOUT = 10
+
+# The Chrome profile of the OPUS browsers: "default" is a visible, maximized incognito window.
+# "performance" is headless, blocks BROWSER_BLOCKED_URLS, runs without extensions and background networking,
+# and keeps a disk cache of OPUS static files in BROWSER_CACHE_PATH, one folder per worker.
+BROWSER_PROFILE = "default"
+BROWSER_CACHE_PATH = "C:\\tmp\\Koerselsgodtgoerelse_browser_cache"
+BROWSER_BLOCKED_URLS = (
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*google-analytics.com*", "*googletagmanager.com*",
+)
+
+# The number of queue elements inserted per call when uploading to the queue
+QUEUE_BATCH_SIZE = 500
+
 # ----------------------
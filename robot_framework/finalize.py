@@ -8,6 +8,8 @@ from OpenOrchestrator.database.queues import QueueStatus
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
 from robot_framework import config
+from robot_framework.subprocesses import status_journal
+from robot_framework.subprocesses.helper_functions import materialize_statuses
 from robot_framework.subprocesses.notify import send_mail
 
 
@@ -43,6 +45,7 @@ def update_sharepoint(orchestrator_connection: OrchestratorConnection):
         file_path = os.path.join(config.PATH, filename)
 
         if os.path.isfile(file_path):  # Ensure it's a file
+            materialize_statuses(filename)
             today = datetime.today()
 
             start_of_day = datetime.combine(today.date(), time.min)   # 00:00:00
@@ -72,6 +75,7 @@ def update_sharepoint(orchestrator_connection: OrchestratorConnection):
 
             # Optionally, delete the file from SharePoint here if needed
             delete_file_from_sharepoint(filename)
+            status_journal.clear(filename)
 
     orchestrator_connection.log_trace(f"SharePoint folder '{folder_dest}' updated.")
     orchestrator_connection.folder_dest = folder_dest
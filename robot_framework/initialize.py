@@ -1,34 +1,61 @@
 """This module defines any initial processes to run when the robot starts."""
 
-import ast
 import glob
 import json
 import os
+import re
 import shutil
-import uuid
-from datetime import datetime
+import time
+from functools import lru_cache
+from typing import Iterator
 
+import numpy as np
+import openpyxl
 import pandas as pd
 import sqlalchemy
-from mbu_dev_shared_components.utils.fernet_encryptor import Encryptor
-from mbu_msoffice_integration.sharepoint_class import Sharepoint
+from pandas.io.parsers import TextParser
+from OpenOrchestrator.database.queues import QueueStatus
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
 from robot_framework import config
+from robot_framework.queue_lease import get_queue_statuses
+from robot_framework.subprocesses import receipt_cache
+from robot_framework.subprocesses.cpr_encryption import encrypt_cpr_column, encryption_pool
+from robot_framework.subprocesses.sharepoint_download import download_files
 
 
-def initialize(orchestrator_connection: OrchestratorConnection) -> None:
+def initialize(orchestrator_connection: OrchestratorConnection, engine: sqlalchemy.Engine) -> None:
     """Primary process of the robot."""
     orchestrator_connection.log_trace("Running process.")
     process_args = json.loads(orchestrator_connection.process_arguments)
     naeste_agent_arg = process_args["naeste_agent"]
 
     delete_all_files_in_path(config.PATH)
-    filename = fetch_files(folder_name=config.DOCUMENT_FOLDER)
-    data_df = load_excel_data(filename)
-    processed_df = process_data(data_df, naeste_agent_arg, filename)
-    approved_df = processed_df[processed_df["is_godkendt"]]
-    upload_to_queue(approved_df, orchestrator_connection)
+    removed_receipts = receipt_cache.prune()
+    filenames = fetch_files(folder_name=config.DOCUMENT_FOLDER)
+    new_form_uuids = set()
+
+    for filename in filenames:
+        if config.EXCEL_CHUNK_SIZE:
+            row_count, column_types = scan_excel(filename, config.EXCEL_CHUNK_SIZE)
+            data_chunks = iter_excel_chunks(filename, config.EXCEL_CHUNK_SIZE, column_types)
+        else:
+            data_df = load_excel_data(filename)
+            row_count, data_chunks = len(data_df), [data_df]
+
+        # One pool encrypts the CPR numbers of all chunks of a large sheet
+        with encryption_pool(row_count) as pool:
+            for data_df in data_chunks:
+                processed_df = process_data(data_df, naeste_agent_arg, filename, pool)
+                approved_df = processed_df[processed_df["is_godkendt"]]
+                if not approved_df.empty:
+                    upload_to_queue(approved_df, orchestrator_connection, engine, new_form_uuids)
+
+    if receipt_cache.enabled():
+        # Like the receipts in PATH, receipts of forms that were processed or failed don't outlive the run
+        removed_receipts += receipt_cache.retain(new_form_uuids)
+    if removed_receipts:
+        orchestrator_connection.log_trace(f"Removed {removed_receipts} receipts from the receipt cache.")
 
 
 def delete_all_files_in_path(path):
@@ -52,40 +79,21 @@ def delete_all_files_in_path(path):
             print(f"Failed to delete {file_path}. Reason: {e}")
 
 
-def fetch_files(folder_name) -> None:
-    """Download Excel files from SharePoint to the specified path."""
+def fetch_files(folder_name) -> list[str]:
+    """Download Excel files from SharePoint to the specified path.
+
+    The files are downloaded to config.DOWNLOAD_CACHE_PATH, which is not wiped between runs,
+    so unchanged files are not downloaded again, and then copied to config.PATH.
+    """
     if not os.path.exists(config.PATH):
         os.makedirs(config.PATH)
 
-    sharepoint = Sharepoint(
-        **config.SHAREPOINT_CREDS,
-        document_library=config.DOCUMENT_LIBRARY,
-        site_url=config.SHAREPOINT_SITE_URL,
-        site_name=config.SHAREPOINT_SITE_NAME,
-    )
-
-    files = sharepoint.fetch_files_list(folder_name)
-
-    # sharepoint.ctx.load(files)
-    # sharepoint.ctx.execute_query()
+    filenames = download_files(folder_name, config.DOWNLOAD_CACHE_PATH)
 
-    if not files:
-        print("No files found in the specified SharePoint folder.")
+    for filename in filenames:
+        shutil.copy2(os.path.join(config.DOWNLOAD_CACHE_PATH, filename), os.path.join(config.PATH, filename))
 
-    filename = None
-
-    for file in files:
-        if file["Name"].endswith(".xlsx"):
-            filename = file["Name"]
-            download_path_file = os.path.join(config.PATH, file["Name"])
-            with open(download_path_file, "wb") as local_file:
-                file_content = sharepoint.fetch_file_using_open_binary(
-                    filename, folder_name
-                )
-                local_file.write(file_content)
-            print(f"Downloaded: {file['Name']} to {download_path_file}")
-
-    return filename
+    return filenames
 
 
 def load_excel_data(filename) -> pd.DataFrame:
@@ -101,6 +109,103 @@ def load_excel_data(filename) -> pd.DataFrame:
     return df
 
 
+def scan_excel(filename, chunk_size: int) -> tuple[int, dict]:
+    """Stream the Excel file once to find its number of rows and the types pd.read_excel would give its columns.
+
+    Returns:
+        tuple[int, dict]: The number of rows, and the column types to pass to iter_excel_chunks.
+    """
+    row_count = 0
+    dtypes = {}
+    filled_dtypes = {}
+    for columns, rows in _iter_excel_rows(filename, chunk_size):
+        row_count += len(rows)
+        chunk = _chunk_to_dataframe(columns, rows)
+        for name, dtype in chunk.dtypes.items():
+            dtypes.setdefault(name, set()).add(dtype)
+            if chunk[name].notna().any():
+                filled_dtypes.setdefault(name, set()).add(dtype)
+
+    column_types = {}
+    for name, column_dtypes in dtypes.items():
+        filled = filled_dtypes.get(name, set())
+        if len(column_dtypes) == 1:
+            continue
+        if all(dtype.kind in "if" for dtype in column_dtypes):
+            column_types[name] = np.dtype(np.float64)  # A blank or a decimal anywhere makes the whole column float
+        elif len(filled) == 1 and next(iter(filled)).kind not in "ifb":
+            column_types[name] = next(iter(filled))  # Text, with blanks in some chunks
+        else:
+            column_types[name] = object  # Mixed, the cells are kept as they are
+    return row_count, column_types
+
+
+def iter_excel_chunks(filename, chunk_size: int, column_types: dict) -> Iterator[pd.DataFrame]:
+    """Stream the Excel file in chunks of chunk_size rows.
+
+    The workbook is opened in read-only mode and only the columns used by process_data
+    are kept, so memory use is bounded by the chunk size and not the size of the sheet.
+    Cells are converted like pd.read_excel does. The type of a column is inferred from the
+    whole sheet by scan_excel, so e.g. a number is formatted the same way in every chunk
+    as with pd.read_excel, whether or not the chunk has blanks.
+    """
+    print("Streaming Excel data...")
+    object_columns = {name: object for name, column_type in column_types.items() if column_type is object}
+    cast_columns = {name: column_type for name, column_type in column_types.items() if column_type is not object}
+
+    for columns, rows in _iter_excel_rows(filename, chunk_size):
+        chunk = _chunk_to_dataframe(columns, rows, object_columns)
+        yield chunk.astype(cast_columns) if cast_columns else chunk
+
+    print(f"Data streamed from: {filename}")
+
+
+def _iter_excel_rows(filename, chunk_size: int) -> Iterator[tuple[list, list]]:
+    """Yield the header of the columns used by process_data and the converted cells of up to chunk_size rows at a time."""
+    excel_files = glob.glob(os.path.join(config.PATH, filename))
+    if not excel_files:
+        raise FileNotFoundError("File not found in the specified folder.")
+
+    workbook = openpyxl.load_workbook(excel_files[0], read_only=True, data_only=True)
+
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        indices = [i for i, name in enumerate(header) if name in PROCESS_COLUMNS]
+        columns = [header[i] for i in indices]
+
+        chunk = []
+        for row in rows:
+            values = [_convert_cell(row[i]) if i < len(row) else "" for i in indices]
+            if all(value == "" for value in values):
+                continue
+
+            chunk.append(values)
+            if len(chunk) == chunk_size:
+                yield columns, chunk
+                chunk = []
+
+        if chunk:
+            yield columns, chunk
+
+    finally:
+        workbook.close()
+
+
+def _convert_cell(value):
+    """Convert a cell value the way pd.read_excel does for the openpyxl engine."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _chunk_to_dataframe(columns: list, rows: list, dtype: dict | None = None) -> pd.DataFrame:
+    """Parse rows of cell values with the same type inference and NA handling as pd.read_excel."""
+    return TextParser([columns] + rows, header=0, dtype=dtype).read()
+
+
 def extract_url_from_attachments(attachments_str: str) -> str:
     """Extract the URL from the attachments string."""
     if isinstance(attachments_str, str):
@@ -112,157 +217,262 @@ def extract_url_from_attachments(attachments_str: str) -> str:
     return pd.NA
 
 
+PROCESS_COLUMNS = (
+    "uuid",
+    "test",
+    "cpr_nr",
+    "cpr_nr_paaanden",
+    "attachments",
+    "skoleliste",
+    "skriv_dit_barns_skole_eller_dagtilbud",
+    "barnets_navn",
+    "aendret_beloeb_i_alt",
+    "beloeb_i_alt",
+    "godkendt",
+    "godkendt_af",
+    "evt_kommentar",
+)
+
+DANISH_MONTHS = (
+    "Januar",
+    "Februar",
+    "Marts",
+    "April",
+    "Maj",
+    "Juni",
+    "Juli",
+    "August",
+    "September",
+    "Oktober",
+    "November",
+    "December",
+)
+
+DATO_PATTERN = re.compile(r"""["']dato["']\s*:\s*["'](\d{4})-(\d{1,2})-(\d{1,2})["']""")
+
+
 def extract_months_and_year(test_str):
-    """Extract months and year from the test string."""
-    month_map = {
-        "January": "Januar",
-        "February": "Februar",
-        "March": "Marts",
-        "April": "April",
-        "May": "Maj",
-        "June": "Juni",
-        "July": "Juli",
-        "August": "August",
-        "September": "September",
-        "October": "Oktober",
-        "November": "November",
-        "December": "December",
-    }
-    data = ast.literal_eval(test_str)
+    """Extract months and year from the test string.
+
+    The 'dato' values are read directly from the serialized list, and the result
+    is memoized since most rows share the same few periods.
+    """
     months = set()
     year = None
 
-    for entry in data:
-        if isinstance(entry, dict) and "dato" in entry:
-            date_str = entry["dato"]
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            month_name = date_obj.strftime("%B")
-            months.add(month_map.get(month_name, month_name))
-            year = date_obj.year
+    for match in DATO_PATTERN.finditer(test_str):
+        year, month = int(match.group(1)), int(match.group(2))
+        if not 1 <= month <= 12:
+            raise ValueError(f"Invalid month in {match.group(0)}")
+        months.add(month)
 
-    sorted_months = sorted(months, key=lambda x: list(month_map.values()).index(x))
+    return _format_months_and_year(frozenset(months), year)
 
-    month_str = "/".join(sorted_months)
-    result = f"{month_str} {year}"
 
-    return result
+@lru_cache(maxsize=1024)
+def _format_months_and_year(months: frozenset, year: int | None) -> str:
+    """Format a set of month numbers and a year as e.g. 'Januar/Februar 2024'."""
+    month_str = "/".join(DANISH_MONTHS[month - 1] for month in sorted(months))
+    return f"{month_str} {year}"
 
 
-def process_data(df: pd.DataFrame, naeste_agent: str, filename) -> pd.DataFrame:
-    """Process the data and return a DataFrame with the required format."""
-    encryptor = Encryptor()
-    processed_data = []
+def process_data(df: pd.DataFrame, naeste_agent: str, filename, pool=None) -> pd.DataFrame:
+    """Process the data and return a DataFrame with the required format.
 
-    for _, row in df.iterrows():
-        month_year = extract_months_and_year(row["test"])
-        cpr_nr = (
-            str(row["cpr_nr_paaanden"])
-            if not pd.isnull(row["cpr_nr_paaanden"])
-            else str(row["cpr_nr"])
-        )
-        attachments_str = str(row.get("attachments", ""))
-        url = extract_url_from_attachments(attachments_str)
-        skoleliste = (
-            str(row["skoleliste"]).lower() if not pd.isnull(row["skoleliste"]) else ""
-        )
-        barnets_navn = str(row["barnets_navn"])
+    Every output column is computed for the whole sheet at once with vectorized
+    pandas operations instead of building the rows one at a time.
 
-        psp_value = determine_psp_value(skoleliste, row)
+    Args:
+        pool (optional): A pool from cpr_encryption.encryption_pool to encrypt the CPR numbers in.
+    """
+    df = df.reset_index(drop=True)
 
-        encrypted_cpr = encryptor.encrypt(cpr_nr).decode("utf-8")
+    month_year = df["test"].map(extract_months_and_year)
 
-        # Ensure that the beloeb value is a string, replace all . with , and keep only the last comma
-        beloeb_value = (
-            row["aendret_beloeb_i_alt"]
-            if not pd.isnull(row["aendret_beloeb_i_alt"])
-            else row["beloeb_i_alt"]
-        )
-        if pd.notnull(beloeb_value):
-            # Replace all periods with commas
-            beloeb_value = str(beloeb_value).replace(".", ",")
-            # If there are multiple commas, keep only the last one
-            if beloeb_value.count(",") > 1:
-                parts = beloeb_value.split(",")
-                # Join all but the last part without commas, then add the last part with a comma
-                beloeb_value = "".join(parts[:-1]) + "," + parts[-1]
-
-        new_row = {
-            "filename": filename,
-            "cpr_encrypted": encrypted_cpr,
-            "barnets_navn": barnets_navn,
-            "beloeb": beloeb_value,
-            "reference": month_year,
-            "arts_konto": "40430002",
-            "psp": psp_value,
-            "posteringstekst": f"Egenbefordring {month_year}",
-            "naeste_agent": naeste_agent,
-            "attachment": url,
-            "uuid": row.get("uuid", pd.NA),
-            "godkendt_af": row.get("godkendt_af", pd.NA),
-            "skole": row["skriv_dit_barns_skole_eller_dagtilbud"]
-            if not pd.isnull(row["skriv_dit_barns_skole_eller_dagtilbud"])
-            else row["skoleliste"],
-            "is_godkendt": "x" in str(row.get("godkendt", "")).lower(),
-            "evt_kommentar": row.get("evt_kommentar"),
-        }
-
-        processed_data.append(new_row)
-
-    df_processed = pd.DataFrame(processed_data)
+    # Stringify before combining so int and float columns keep their own formatting
+    cpr_nr = _as_str(df["cpr_nr_paaanden"]).where(
+        df["cpr_nr_paaanden"].notna(), _as_str(df["cpr_nr"])
+    )
+    encrypted_cpr = encrypt_cpr_column(cpr_nr, pool=pool)
+
+    url = _column(df, "attachments", "").pipe(_as_str).str.extract(
+        r"(https://[^']*)'", expand=False
+    )
+    url = url.astype(object).where(url.notna(), pd.NA)
+
+    skoleliste = _as_str(df["skoleliste"]).str.lower().where(df["skoleliste"].notna(), "")
+    psp_value = determine_psp_values(skoleliste, df["skriv_dit_barns_skole_eller_dagtilbud"])
+
+    # Ensure that the beloeb value is a string, replace all . with , and keep only the last comma
+    beloeb_value = _as_str(df["aendret_beloeb_i_alt"]).where(
+        df["aendret_beloeb_i_alt"].notna(), _as_str(df["beloeb_i_alt"])
+    )
+    beloeb_value = beloeb_value.str.replace(".", ",", regex=False).str.replace(
+        r",(?=.*,)", "", regex=True
+    )
+    beloeb_value = beloeb_value.where(
+        df["aendret_beloeb_i_alt"].notna() | df["beloeb_i_alt"].notna(),
+        df["beloeb_i_alt"].astype(object),
+    )
+
+    columns = {
+        "filename": filename,
+        "cpr_encrypted": encrypted_cpr,
+        "barnets_navn": _as_str(df["barnets_navn"]),
+        "beloeb": beloeb_value,
+        "reference": month_year,
+        "arts_konto": "40430002",
+        "psp": psp_value,
+        "posteringstekst": "Egenbefordring " + month_year,
+        "naeste_agent": naeste_agent,
+        "attachment": url,
+        "uuid": _column(df, "uuid", pd.NA),
+        "godkendt_af": _column(df, "godkendt_af", pd.NA),
+        "skole": df["skriv_dit_barns_skole_eller_dagtilbud"].astype(object).where(
+            df["skriv_dit_barns_skole_eller_dagtilbud"].notna(), df["skoleliste"].astype(object)
+        ),
+        "is_godkendt": _as_str(_column(df, "godkendt", ""))
+        .str.lower()
+        .str.contains("x", regex=False),
+        "evt_kommentar": _column(df, "evt_kommentar", None),
+    }
+
+    # Build from plain lists so the column dtypes are inferred exactly as for the per-row records
+    df_processed = pd.DataFrame(
+        {
+            name: values.tolist() if isinstance(values, pd.Series) else values
+            for name, values in columns.items()
+        },
+        index=df.index,
+    )
 
     return df_processed
 
 
-def determine_psp_value(skoleliste: str, row: pd.Series) -> str:
-    """Determine PSP value based on school list."""
+def _column(df: pd.DataFrame, name: str, default) -> pd.Series:
+    """Return the named column as objects, or a column filled with default if it is missing."""
+    if name in df.columns:
+        return df[name].astype(object)
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
 
-    if (
-        "langagerskolen" in skoleliste
-        or "751090#1830" in skoleliste
-        or "751090#2471" in skoleliste
-    ):
-        return "XG-5240220808-00004"
 
-    if (
-        "stensagerskolen" in skoleliste
-        or "751903#591" in skoleliste
-        or "751903#2521" in skoleliste
-    ):
-        return "XG-5240220808-00005"
+def _as_str(series: pd.Series) -> pd.Series:
+    """Convert every value with str(), exactly like the row-by-row conversion did (NaN becomes 'nan')."""
+    return pd.Series(
+        series.to_numpy(dtype=object).astype(str), index=series.index, dtype=object
+    )
 
-    if not pd.isnull(row["skriv_dit_barns_skole_eller_dagtilbud"]):
-        return "XG-5240220808-00006"
 
-    # Default PSP value
-    return "XG-5240220808-00003"
+def compile_psp_rules(rules) -> re.Pattern:
+    """Compile the PSP rule table into a single pattern with a named group per rule.
+
+    Every alternative is a lookahead, so all rules matching anywhere in the text are found,
+    also when their patterns overlap.
+    """
+    return re.compile(
+        "|".join(
+            f"(?=(?P<rule{i}>{'|'.join(re.escape(pattern.lower()) for pattern in patterns)}))"
+            for i, (patterns, _) in enumerate(rules)
+        )
+    )
 
 
-def make_unique_references(references: list) -> list:
-    """Generate unique references by appending UUIDs."""
-    return [f"{ref}_{uuid.uuid4().hex}" for ref in references]
+PSP_PATTERN = compile_psp_rules(config.PSP_RULES)
+
+
+def determine_psp_values(skoleliste: pd.Series, skole_fritekst: pd.Series) -> pd.Series:
+    """Determine PSP values for a whole column of lower-cased school lists.
+
+    The first rule in config.PSP_RULES with a pattern in the school list wins. Otherwise
+    the free-text school PSP is used if the school is written in, and else the default.
+    Each distinct school list is only matched once.
+    """
+    codes, school_lists = pd.factorize(skoleliste)
+    rule_per_school_list = np.array([_first_matching_rule(text) for text in school_lists] + [-1], dtype=int)
+    rule_per_row = rule_per_school_list[codes]
+
+    # The extra None is looked up by rows without a matching rule (index -1)
+    psp_per_rule = np.array([psp for _, psp in config.PSP_RULES] + [None], dtype=object)
+    fallback = np.where(skole_fritekst.notna().to_numpy(), config.PSP_FREETEXT_SCHOOL, config.PSP_DEFAULT)
+
+    return pd.Series(
+        np.where(rule_per_row >= 0, psp_per_rule[rule_per_row], fallback),
+        index=skoleliste.index,
+        dtype=object,
+    )
+
+
+def _first_matching_rule(text: str) -> int:
+    """Return the index of the first PSP rule matching the text, or -1 if none match."""
+    return min(
+        (int(match.lastgroup.removeprefix("rule")) for match in PSP_PATTERN.finditer(text) if match.lastgroup),
+        default=-1,
+    )
 
 
 def upload_to_queue(
-    result_df: pd.DataFrame, orchestrator_connection: OrchestratorConnection
-) -> None:
-    """Upload the processed data to the orchestrator queue."""
+    result_df: pd.DataFrame,
+    orchestrator_connection: OrchestratorConnection,
+    engine: sqlalchemy.Engine,
+    new_form_uuids: set[str] | None = None,
+) -> tuple[int, int]:
+    """Upload the processed data to the orchestrator queue.
+
+    The form uuid is the reference of its queue element, so the rows already in the queue are
+    looked up by their uuids and skipped. The rest are inserted in batches of config.QUEUE_BATCH_SIZE,
+    so a conflict only loses its own batch.
+
+    Args:
+        result_df: The processed rows to upload.
+        orchestrator_connection: The connection to OpenOrchestrator.
+        engine: An engine on the OpenOrchestrator database.
+        new_form_uuids (optional): Updated with the uuids of the rows that are 'New' in the queue, inserted or not.
+
+    Returns:
+        tuple[int, int]: The number of inserted and skipped rows.
+    """
+    start_time = time.perf_counter()
+
+    form_uuids = result_df["uuid"].astype(str)
+    queue_statuses = get_queue_statuses(engine, config.QUEUE_NAME, form_uuids.unique().tolist())
+    if new_form_uuids is not None:
+        new_form_uuids.update(form_uuid for form_uuid, status in queue_statuses.items() if status == QueueStatus.NEW)
+
+    is_new = ~form_uuids.isin(queue_statuses.keys())
+    new_df = result_df[is_new]
+    skipped = len(result_df) - len(new_df)
+
     queue_data = [
         json.dumps(data, ensure_ascii=False, default=str)
-        for data in result_df.to_dict(orient="records")
+        for data in new_df.to_dict(orient="records")
     ]
-    queue_references = [str(row["posteringstekst"]) for _, row in result_df.iterrows()]
-    unique_references = make_unique_references(queue_references)
+    queue_references = form_uuids[is_new].tolist()
 
-    try:
-        print("Uploading data to queue...")
-        orchestrator_connection.bulk_create_queue_elements(
-            config.QUEUE_NAME, references=unique_references, data=queue_data
-        )
-        print("Data uploaded to queue successfully.")
-        orchestrator_connection.log_trace("Data uploaded to queue.")
+    inserted = 0
+    print("Uploading data to queue...")
+    for i in range(0, len(queue_data), config.QUEUE_BATCH_SIZE):
+        batch = slice(i, i + config.QUEUE_BATCH_SIZE)
 
-    except sqlalchemy.exc.IntegrityError as ie:
-        print(f"IntegrityError: {ie.orig}")
+        try:
+            orchestrator_connection.bulk_create_queue_elements(
+                config.QUEUE_NAME, references=queue_references[batch], data=queue_data[batch]
+            )
+            inserted += len(queue_data[batch])
+            if new_form_uuids is not None:
+                new_form_uuids.update(queue_references[batch])
+
+        except sqlalchemy.exc.IntegrityError as ie:
+            print(f"IntegrityError: {ie.orig}")
+
+        except (ValueError, TypeError) as e:
+            print(f"Error occurred: {e}")
+
+    elapsed = time.perf_counter() - start_time
+    message = (
+        f"Queue upload: {inserted} inserted, {skipped} already in queue, "
+        f"{len(queue_data) - inserted} failed, in {elapsed:.1f}s ({inserted / elapsed if elapsed else 0:.0f} elements/s)."
+    )
+    print(message)
+    orchestrator_connection.log_trace(message)
 
-    except (ValueError, TypeError) as e:
-        print(f"Error occurred: {e}")
+    return inserted, skipped
@@ -4,100 +4,232 @@
 # pylint: disable=duplicate-code
 
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from OpenOrchestrator.database.queues import QueueStatus
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+from sqlalchemy import create_engine
 
 from robot_framework import config, finalize, initialize, process, reset
+from robot_framework.cached_connection import CachedOrchestratorConnection
 from robot_framework.exceptions import BusinessError, handle_error, log_exception
+from robot_framework.queue_lease import QueueLeaseClaimer
+from robot_framework.subprocesses.cpr_encryption import get_encryptor
+from robot_framework.subprocesses.get_os2form_receipt import fetch_receipt
 from robot_framework.subprocesses.outlay_ticket_creation import initialize_browser
+from robot_framework.subprocesses.receipt_download import download_receipts
+from robot_framework.subprocesses.receipt_prefetch import ReceiptPrefetcher
+from robot_framework.subprocesses.status_writer import close_status_writers
 
 
 def main():
     """The entry point for the framework. Should be called as the first thing when running the robot."""
-    orchestrator_connection = OrchestratorConnection.create_connection_from_args()
+    orchestrator_connection = CachedOrchestratorConnection(OrchestratorConnection.create_connection_from_args())
     sys.excepthook = log_exception(orchestrator_connection)
 
     orchestrator_connection.log_trace("Robot Framework started.")
-    initialize.initialize(orchestrator_connection)
-    opus_username = orchestrator_connection.get_credential(
-        "egenbefordring_udbetaling"
-    ).username
-    opus_password = orchestrator_connection.get_credential(
-        "egenbefordring_udbetaling"
-    ).password
+    # The same connection string OrchestratorConnection.create_connection_from_args connects with
+    engine = create_engine(sys.argv[2])
+
+    initialize.initialize(orchestrator_connection, engine)
+    # Load the key before the workers start, so it is not loaded while an element is processed
+    get_encryptor()
+    if config.RECEIPT_DOWNLOAD_CONCURRENCY:
+        download_receipts(orchestrator_connection, engine, orchestrator_connection.get_credential(config.OS2_API_CREDENTIAL).password)
+    opus_credential = orchestrator_connection.get_credential("egenbefordring_udbetaling")
+    opus_username = opus_credential.username
+    opus_password = opus_credential.password
+
+    queue_claimer = None
+    if config.QUEUE_CLAIM_BATCH_SIZE > 1:
+        queue_claimer = QueueLeaseClaimer(
+            engine,
+            config.QUEUE_NAME,
+            config.QUEUE_CLAIM_BATCH_SIZE,
+            config.QUEUE_LEASE_SECONDS,
+        )
+
+    error_counts = run_workers(
+        orchestrator_connection,
+        lambda: initialize_browser(opus_username, opus_password),
+        config.WORKER_COUNT,
+        queue_claimer,
+    )
+    # Write the pending status updates before the run is reported
+    close_status_writers()
 
+    reset.clean_up(orchestrator_connection)
+    reset.close_all(orchestrator_connection)
+    reset.kill_all(orchestrator_connection)
+
+    orchestrator_connection.log_trace(
+        f"Orchestrator cache: {orchestrator_connection.hits} hits, {orchestrator_connection.misses} misses."
+    )
+
+    if config.FAIL_ROBOT_ON_TOO_MANY_ERRORS and config.MAX_RETRY_COUNT in error_counts:
+        raise RuntimeError("Process failed too many times.")
+
+    finalize.finalize(orchestrator_connection)
+
+
+class QueueWorkerPool:
+    """Shared state of the queue workers: the task count, the queue claims and the shutdown flag."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, queue_claimer: QueueLeaseClaimer | None = None):
+        self.orchestrator_connection = orchestrator_connection
+        self.queue_claimer = queue_claimer
+        self.task_count = 0
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def claim_task(self) -> bool:
+        """Count a task towards config.MAX_TASK_COUNT. Returns False if the limit is reached or the pool is stopping."""
+        with self._lock:
+            if self.stop_event.is_set() or self.task_count >= config.MAX_TASK_COUNT:
+                return False
+            self.task_count += 1
+            return True
+
+    def get_next_queue_element(self):
+        """Get the next queue element. Calls are serialized so two workers never get the same element."""
+        if self.stop_event.is_set():
+            return None
+        with self._lock:
+            if self.queue_claimer:
+                return self.queue_claimer.next()
+            return self.orchestrator_connection.get_next_queue_element(config.QUEUE_NAME)
+
+    def release(self) -> None:
+        """Set queue elements claimed in a batch but not processed back to 'New'."""
+        if self.queue_claimer:
+            with self._lock:
+                released = self.queue_claimer.release()
+            if released:
+                self.orchestrator_connection.log_trace(f"Released {released} claimed queue elements.")
+
+
+def run_workers(orchestrator_connection: OrchestratorConnection, browser_factory, worker_count: int = 1,
+                queue_claimer: QueueLeaseClaimer | None = None) -> list[int]:
+    """Process the queue with worker_count workers, each with its own browser.
+
+    With a single worker the queue is processed on the calling thread.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        browser_factory: Callable returning a new logged-in browser.
+        worker_count: The number of workers.
+        queue_claimer (optional): Claims queue elements in batches. If None they are fetched one at a time.
+
+    Returns:
+        list[int]: The number of application errors of each worker.
+    """
+    pool = QueueWorkerPool(orchestrator_connection, queue_claimer)
+
+    try:
+        if worker_count <= 1:
+            return [process_queue(pool, browser_factory)]
+
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="queue_worker") as executor:
+            futures = [executor.submit(process_queue, pool, browser_factory) for _ in range(worker_count)]
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                # Let the workers finish their current element and stop claiming new ones
+                pool.stop_event.set()
+                raise
+
+    finally:
+        pool.release()
+
+
+def process_queue(pool: QueueWorkerPool, browser_factory) -> int:
+    """Process queue elements with one browser until the queue is empty or the pool stops.
+
+    Returns:
+        int: The number of application errors.
+    """
+    orchestrator_connection = pool.orchestrator_connection
     browser = None
     queue_element = None
+    receipt = None
     error_count = 0
-    task_count = 0
-    # Retry loop
-    for _ in range(config.MAX_RETRY_COUNT):
-        try:
-            reset.reset(orchestrator_connection)
-
-            # Only fetch a new queue element if none exists
-            if queue_element is None:
-                queue_element = orchestrator_connection.get_next_queue_element(
-                    config.QUEUE_NAME
+
+    prefetcher = None
+    if config.RECEIPT_LOOKAHEAD:
+        prefetcher = ReceiptPrefetcher(
+            orchestrator_connection,
+            pool.get_next_queue_element,
+            lambda element: fetch_receipt(element, orchestrator_connection.get_credential(config.OS2_API_CREDENTIAL).password, orchestrator_connection),
+            config.RECEIPT_LOOKAHEAD,
+        )
+        prefetcher.start()
+
+    try:
+        # Retry loop
+        for _ in range(config.MAX_RETRY_COUNT):
+            try:
+                reset.reset(orchestrator_connection)
+
+                if browser is None:
+                    browser = browser_factory()
+
+                # Queue loop
+                while pool.claim_task():
+                    if (
+                        queue_element is None
+                    ):  # Fetch the next element if the current is None
+                        queue_element, receipt = next_queue_element(pool, prefetcher)
+
+                    if not queue_element:
+                        orchestrator_connection.log_info("Queue empty.")
+                        break  # Break queue loop
+
+                    try:
+                        process.process(orchestrator_connection, queue_element, browser, receipt)
+                        orchestrator_connection.set_queue_element_status(
+                            queue_element.id, QueueStatus.DONE, "Success"
+                        )
+                        queue_element = None  # Reset the queue element on success
+
+                    except BusinessError as error:
+                        handle_error(
+                            orchestrator_connection=orchestrator_connection,
+                            message="Business Error",
+                            error=error,
+                            queue_element=queue_element,
+                        )
+                        orchestrator_connection.set_queue_element_status(
+                            queue_element.id, QueueStatus.FAILED, "Business Error"
+                        )
+                        queue_element = None  # Move to the next queue element after handling BusinessError
+
+                break  # Break retry loop
+
+            # We actually want to catch all exceptions possible here.
+            # pylint: disable-next = broad-exception-caught
+            except Exception as error:
+                error_count += 1
+                receipt = None  # Download the receipt again when the element is retried
+                handle_error(
+                    orchestrator_connection=orchestrator_connection,
+                    message="ApplicationException",
+                    error_count=error_count,
+                    error=error,
+                    queue_element=queue_element,
                 )
 
-            if browser is None:
-                browser = initialize_browser(opus_username, opus_password)
-
-            # Queue loop
-            while task_count < config.MAX_TASK_COUNT:
-                if (
-                    queue_element is None
-                ):  # Fetch the next element if the current is None
-                    queue_element = orchestrator_connection.get_next_queue_element(
-                        config.QUEUE_NAME
-                    )
-
-                if not queue_element:
-                    orchestrator_connection.log_info("Queue empty.")
-                    break  # Break queue loop
-
-                task_count += 1  # Increment task count
-
-                try:
-                    process.process(orchestrator_connection, queue_element, browser)
-                    orchestrator_connection.set_queue_element_status(
-                        queue_element.id, QueueStatus.DONE, "Success"
-                    )
-                    queue_element = None  # Reset the queue element on success
-
-                except BusinessError as error:
-                    handle_error(
-                        orchestrator_connection=orchestrator_connection,
-                        message="Business Error",
-                        error=error,
-                        queue_element=queue_element,
-                    )
-                    orchestrator_connection.set_queue_element_status(
-                        queue_element.id, QueueStatus.FAILED, "Business Error"
-                    )
-                    queue_element = None  # Move to the next queue element after handling BusinessError
-
-            break  # Break retry loop
-
-        # We actually want to catch all exceptions possible here.
-        # pylint: disable-next = broad-exception-caught
-        except Exception as error:
-            error_count += 1
-            handle_error(
-                orchestrator_connection=orchestrator_connection,
-                message="ApplicationException",
-                error_count=error_count,
-                error=error,
-                queue_element=queue_element,
-            )
+    finally:
+        if prefetcher:
+            prefetcher.close()
+        if browser is not None:
+            browser.quit()
 
-    reset.clean_up(orchestrator_connection)
-    reset.close_all(orchestrator_connection)
-    reset.kill_all(orchestrator_connection)
+    return error_count
 
-    if config.FAIL_ROBOT_ON_TOO_MANY_ERRORS and error_count == config.MAX_RETRY_COUNT:
-        raise RuntimeError("Process failed too many times.")
 
-    finalize.finalize(orchestrator_connection)
+def next_queue_element(pool: QueueWorkerPool, prefetcher: ReceiptPrefetcher | None) -> tuple:
+    """Return the next queue element and the Future of its prefetched receipt, or None for either."""
+    if prefetcher is None:
+        return pool.get_next_queue_element(), None
+    return prefetcher.next() or (None, None)
@@ -0,0 +1,126 @@
+"""This module contains the logic for claiming queue elements in batches under a lease, and for looking up queue elements directly in the database."""
+
+import uuid
+from datetime import datetime, timedelta
+
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
+from sqlalchemy import Engine, select, update
+from sqlalchemy.orm import Session
+
+LEASE_PREFIX = "Lease:"
+
+# SQL Server allows 2100 parameters per statement
+LOOKUP_CHUNK_SIZE = 1000
+
+
+class QueueLeaseClaimer:
+    """Claims up to batch_size queue elements in one transaction and hands them out one at a time.
+
+    Claimed elements are set to 'In Progress' with a lease marker in their message. The marker is
+    replaced when an element starts processing (see process.process_single_queue_element), so only
+    elements that are still waiting in the buffer hold the lease. These are set back to 'New' by
+    release(), or by any robot claiming from the queue once lease_seconds have passed.
+    """
+
+    def __init__(self, engine: Engine, queue_name: str, batch_size: int, lease_seconds: int):
+        self.engine = engine
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.lease_duration = timedelta(seconds=lease_seconds)
+        self.lease_marker = f"{LEASE_PREFIX}{uuid.uuid4().hex}"
+        self._buffer = []
+        self._lease_start = None
+
+    def next(self) -> QueueElement | None:
+        """Return the next claimed queue element, claiming a new batch if the buffer is empty."""
+        if self._buffer and datetime.now() - self._lease_start > self.lease_duration / 2:
+            # Don't hand out elements another robot may soon take over
+            self.release()
+
+        if not self._buffer:
+            self._buffer = self.claim()
+
+        return self._buffer.pop(0) if self._buffer else None
+
+    def claim(self) -> list[QueueElement]:
+        """Release expired leases in the queue and claim the next batch of elements."""
+        now = datetime.now()
+
+        with Session(self.engine, expire_on_commit=False) as session, session.begin():
+            session.execute(
+                update(QueueElement)
+                .where(QueueElement.queue_name == self.queue_name)
+                .where(QueueElement.status == QueueStatus.IN_PROGRESS)
+                .where(QueueElement.message.like(f"{LEASE_PREFIX}%"))
+                .where(QueueElement.start_date < now - self.lease_duration)
+                .values(status=QueueStatus.NEW, message=None, start_date=None)
+            )
+
+            queue_elements = session.scalars(
+                select(QueueElement)
+                .where(QueueElement.queue_name == self.queue_name)
+                .where(QueueElement.status == QueueStatus.NEW)
+                .order_by(QueueElement.created_date)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+
+            for queue_element in queue_elements:
+                queue_element.status = QueueStatus.IN_PROGRESS
+                queue_element.start_date = now
+                queue_element.message = self.lease_marker
+
+        self._lease_start = now
+        return list(queue_elements)
+
+    def release(self) -> int:
+        """Set the claimed elements that have not been handed out back to 'New'.
+
+        Returns:
+            int: The number of released elements.
+        """
+        ids = [queue_element.id for queue_element in self._buffer]
+        self._buffer = []
+        if not ids:
+            return 0
+
+        with Session(self.engine) as session, session.begin():
+            result = session.execute(
+                update(QueueElement)
+                .where(QueueElement.id.in_(ids))
+                .where(QueueElement.message == self.lease_marker)
+                .values(status=QueueStatus.NEW, message=None, start_date=None)
+            )
+
+        return result.rowcount
+
+
+def get_new_queue_elements(engine: Engine, queue_name: str, limit: int) -> list[QueueElement]:
+    """Return the next limit 'New' elements of a queue, oldest first like they are claimed, without claiming them.
+
+    OpenOrchestrator's get_queue_elements returns the newest elements first, so it can't be used to look ahead.
+    """
+    with Session(engine) as session:
+        return list(session.scalars(
+            select(QueueElement)
+            .where(QueueElement.queue_name == queue_name)
+            .where(QueueElement.status == QueueStatus.NEW)
+            .order_by(QueueElement.created_date)
+            .limit(limit)
+        ).all())
+
+
+def get_queue_statuses(engine: Engine, queue_name: str, references: list[str]) -> dict[str, QueueStatus]:
+    """Return the status of the elements of a queue with the given references, in one query per LOOKUP_CHUNK_SIZE references.
+
+    References not in the queue are left out. If several elements share a reference, any of their statuses is returned.
+    """
+    statuses = {}
+    with Session(engine) as session:
+        for i in range(0, len(references), LOOKUP_CHUNK_SIZE):
+            statuses.update(session.execute(
+                select(QueueElement.reference, QueueElement.status)
+                .where(QueueElement.queue_name == queue_name)
+                .where(QueueElement.reference.in_(references[i:i + LOOKUP_CHUNK_SIZE]))
+            ).all())
+    return statuses
@@ -43,11 +43,13 @@ def get_incident(orchestrator_connection):
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.get(get_url, headers=headers, auth=(service_now_api_username, service_now_api_password))
+    invalidate_credential_on_auth_failure(orchestrator_connection, response)
 
     # pylint: disable=no-else-return
     if response.status_code == 200:
@@ -97,11 +99,13 @@ def update_incident(orchestrator_connection, error_dict, existing_incident_sys_i
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.put(put_url, headers=headers, auth=(service_now_api_username, service_now_api_password), json=incident_data)
+    invalidate_credential_on_auth_failure(orchestrator_connection, response)
 
     # pylint: disable=no-else-return
     if response.status_code == 200:
@@ -143,11 +147,13 @@ def post_incident(orchestrator_connection, error_dict):
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.post(post_url, headers=headers, auth=(service_now_api_username, service_now_api_password), json=incident_data)
+    invalidate_credential_on_auth_failure(orchestrator_connection, response)
 
     print()
     print("Response Status Code:", response.status_code)
@@ -161,3 +167,9 @@ def post_incident(orchestrator_connection, error_dict):
         print(f"Error {response.status_code}: {response.text}")
 
         return None
+
+
+def invalidate_credential_on_auth_failure(orchestrator_connection, response):
+    """Drop the cached ServiceNow credential if it was rejected, so the next request fetches it again."""
+    if response.status_code == 401:
+        orchestrator_connection.invalidate(config.SERVICE_NOW_API_PROD_USER)
@@ -0,0 +1,87 @@
+"""This module contains the shared encryptor and the logic for encrypting and decrypting CPR numbers in bulk."""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+
+from mbu_dev_shared_components.utils.fernet_encryptor import Encryptor
+
+from robot_framework import config
+
+
+@lru_cache(maxsize=1)
+def get_encryptor() -> Encryptor:
+    """Return the Encryptor of the current process, loading the key on first use.
+
+    The key is loaded once per process, and only the cipher derived from it is kept.
+    """
+    encryptor = Encryptor()
+    # The key is only read when the cipher is derived in __init__, so it is not kept on the shared instance
+    encryptor.key = None
+    return encryptor
+
+
+@contextmanager
+def encryption_pool(row_count: int, max_workers: int | None = None) -> Iterator[ProcessPoolExecutor | None]:
+    """A process pool to encrypt all batches of a sheet of row_count rows in, where each worker loads the key once.
+
+    Yields None if the sheet has fewer than config.ENCRYPTION_POOL_THRESHOLD rows, so it is encrypted in the current process.
+    """
+    if row_count < config.ENCRYPTION_POOL_THRESHOLD:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=get_encryptor) as pool:
+        yield pool
+
+
+def encrypt_cpr_column(cpr_numbers: list[str], max_workers: int | None = None,
+                       pool: ProcessPoolExecutor | None = None) -> list[str]:
+    """Encrypt a whole column of CPR numbers and return the tokens as strings in the same order.
+
+    Small batches are encrypted in the current process. Larger batches are split in chunks
+    and encrypted across a process pool where each worker loads the key once.
+
+    Args:
+        pool (optional): A pool from encryption_pool to encrypt in, whatever the size of the batch.
+    """
+    return _map_chunks(_encrypt_chunk, cpr_numbers, max_workers, pool)
+
+
+def decrypt_cpr_column(tokens: list[str], max_workers: int | None = None,
+                       pool: ProcessPoolExecutor | None = None) -> list[str]:
+    """Decrypt a whole column of encrypted CPR numbers, e.g. to validate them before processing,
+    and return them in the same order. See encrypt_cpr_column.
+
+    Raises:
+        ValueError: If a token cannot be decrypted with the key.
+    """
+    return _map_chunks(_decrypt_chunk, tokens, max_workers, pool)
+
+
+def _map_chunks(function, values: list[str], max_workers: int | None, pool: ProcessPoolExecutor | None) -> list[str]:
+    """Apply a chunk function to values in pool, or in a new process pool if there are more than
+    config.ENCRYPTION_POOL_THRESHOLD values.
+    """
+    values = list(values)
+
+    if pool is None:
+        with encryption_pool(len(values), max_workers) as new_pool:
+            if new_pool is None:
+                return function(values)
+            return _map_chunks(function, values, max_workers, new_pool)
+
+    chunk_size = config.ENCRYPTION_CHUNK_SIZE
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    return [value for chunk in pool.map(function, chunks) for value in chunk]
+
+
+def _encrypt_chunk(cpr_numbers: list[str]) -> list[str]:
+    """Encrypt a chunk of CPR numbers with the Encryptor of the current process."""
+    encryptor = get_encryptor()
+    return [encryptor.encrypt(cpr_nr).decode("utf-8") for cpr_nr in cpr_numbers]
+
+
+def _decrypt_chunk(tokens: list[str]) -> list[str]:
+    """Decrypt a chunk of encrypted CPR numbers with the Encryptor of the current process."""
+    encryptor = get_encryptor()
+    return [encryptor.decrypt(token.encode("utf-8")) for token in tokens]
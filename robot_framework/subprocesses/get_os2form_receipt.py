@@ -1,17 +1,33 @@
 """This module contains the logic for fetching a receipt from OS2FORMS."""
 import json
 import os
-from mbu_dev_shared_components.os2forms import documents
 import requests
 
 from robot_framework import config
+from robot_framework.cached_connection import invalidate
+from robot_framework.subprocesses import receipt_cache
+
+PDF_HEADER = b"%PDF-"
+PDF_TRAILER = b"%%EOF"
+# The trailer may be followed by whitespace or, in some generators, a little junk
+PDF_TRAILER_WINDOW = 1024
+
+
+class InvalidReceiptError(Exception):
+    """Raised when a downloaded receipt is truncated or not a PDF."""
+
+
+def receipt_path(element_data: dict) -> str:
+    """Return the path the receipt of a queue element is saved to."""
+    filename_without_ext = os.path.splitext(element_data['filename'])[0]
+    return os.path.join(config.PATH, filename_without_ext, f"receipt_{element_data['uuid']}.pdf")
 
 
 def fetch_receipt(queue_element, os2_api_key, orchestrator_connection):
-    """Fetch a receipt from OS2FORMS and save it to the specified path."""
+    """Fetch a receipt from OS2FORMS and save it to the specified path.
+    A receipt already downloaded by receipt_download.download_receipts, or in the receipt cache, is used as is.
+    """
     element_data = json.loads(queue_element.data)
-    filename = element_data['filename']
-    filename_without_ext = os.path.splitext(filename)[0]
     url = element_data.get('attachment')
     uuid = element_data.get('uuid')
 
@@ -19,29 +35,94 @@ def fetch_receipt(queue_element, os2_api_key, orchestrator_connection):
         error_message = "Missing 'attachment' URL or 'uuid' in element data."
         raise ValueError(error_message)
 
-    try:
-        # Download the file bytes
-        file_content = documents.download_file_bytes(url, os2_api_key)
-
-        new_path = os.path.join(config.PATH, filename_without_ext)
-        if not os.path.exists(new_path):
-            os.makedirs(new_path)
+    file_path = receipt_path(element_data)
+    new_path = os.path.dirname(file_path)
+    if os.path.exists(file_path):
+        orchestrator_connection.log_trace(f"Using downloaded file {file_path}.")
+        return new_path
+    if receipt_cache.get(uuid, file_path):
+        orchestrator_connection.log_trace(f"Using cached file {file_path}.")
+        return new_path
 
-        filename = f"receipt_{uuid}.pdf"
-        file_path = os.path.join(new_path, filename)
-
-        # Save the file content
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+    try:
+        with requests.get(url, headers=os2_headers(os2_api_key), stream=True, timeout=config.RECEIPT_DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            save_receipt(response, file_path)
+        receipt_cache.put(uuid, file_path)
 
         orchestrator_connection.log_trace(f"File downloaded and saved successfully to {file_path}.")
 
     except requests.exceptions.RequestException as e:
+        if e.response is not None and e.response.status_code in (401, 403):
+            invalidate(orchestrator_connection, config.OS2_API_CREDENTIAL)
         error_message = f"Network error downloading file from OS2FORMS: {e}"
         raise RuntimeError(error_message) from e
 
+    except InvalidReceiptError as e:
+        error_message = f"Invalid file downloaded from OS2FORMS: {e}"
+        raise RuntimeError(error_message) from e
+
     except OSError as e:
         error_message = f"Error saving the file from OS2FORMS: {e}"
         raise RuntimeError(error_message) from e
 
     return new_path
+
+
+def os2_headers(os2_api_key: str) -> dict:
+    """Return the headers for a request to the OS2Forms API."""
+    return {
+        'Content-Type': 'application/json',
+        'api-key': f'{os2_api_key}'
+    }
+
+
+def save_receipt(response: requests.Response, file_path: str) -> int:
+    """Stream a receipt from a response opened with stream=True to file_path.
+
+    The receipt is written in chunks of config.RECEIPT_CHUNK_SIZE to a temporary file, checked
+    against the Content-Length and for a PDF header and trailer, and then renamed into place,
+    so file_path only ever holds a complete receipt.
+
+    Returns:
+        int: The size of the receipt in bytes.
+
+    Raises:
+        InvalidReceiptError: If the receipt is truncated or not a PDF.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    part_path = file_path + ".part"
+
+    size = 0
+    head = b""
+    tail = b""
+    try:
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=config.RECEIPT_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+                if len(head) < len(PDF_HEADER):
+                    head += chunk[:len(PDF_HEADER)]
+                tail = (tail + chunk[-PDF_TRAILER_WINDOW:])[-PDF_TRAILER_WINDOW:]
+
+        _check_receipt(response, size, head, tail)
+        os.replace(part_path, file_path)
+
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    return size
+
+
+def _check_receipt(response: requests.Response, size: int, head: bytes, tail: bytes):
+    """Raise InvalidReceiptError if the downloaded receipt is incomplete or not a PDF."""
+    content_length = response.headers.get('Content-Length')
+    # With a Content-Encoding the length is of the encoded body, not the bytes written
+    if content_length is not None and 'Content-Encoding' not in response.headers and int(content_length) != size:
+        raise InvalidReceiptError(f"Expected {content_length} bytes but got {size}.")
+    if not head.startswith(PDF_HEADER):
+        raise InvalidReceiptError("The file does not start with a PDF header.")
+    if PDF_TRAILER not in tail:
+        raise InvalidReceiptError("The file has no PDF trailer, it may be truncated.")
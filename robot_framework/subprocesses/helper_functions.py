@@ -2,15 +2,25 @@
 import json
 import os
 import glob
+import threading
 import pandas as pd
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
-from mbu_dev_shared_components.utils.db_stored_procedure_executor import execute_stored_procedure
 
+from robot_framework import config
 from robot_framework.config import PATH
+from robot_framework.subprocesses import status_journal
+from robot_framework.subprocesses.status_writer import get_status_writer
+
+# Queue workers share the Excel file, so the read-modify-write must not interleave
+EXCEL_LOCK = threading.Lock()
 
 
 def handle_post_process(failed, queue_element, orchestrator_connection: OrchestratorConnection, db_status):
-    """Update the Excel file with the status of the element."""
+    """Record the status of the element in the status journal.
+
+    The Excel file is only rewritten every config.STATUS_CHECKPOINT_INTERVAL statuses,
+    and by finalize before it is uploaded.
+    """
     element_data = json.loads(queue_element.data)
     uuid = element_data['uuid']
     excel_filename = element_data['filename']
@@ -20,20 +30,28 @@ def handle_post_process(failed, queue_element, orchestrator_connection: Orchestr
     if not excel_files:
         raise FileNotFoundError(f"{excel_filename} not found in {PATH}.")
 
-    file_to_read = excel_files[0]
-    df = pd.read_excel(file_to_read, engine='openpyxl')
-    df = ensure_columns(df)
-    update_dataframe(df, uuid, failed)
+    record_count = status_journal.record_status(excel_filename, uuid, failed)
+    if config.STATUS_CHECKPOINT_INTERVAL and record_count % config.STATUS_CHECKPOINT_INTERVAL == 0:
+        materialize_statuses(excel_filename)
+
+    get_status_writer(connection_string).submit(db_status)
+    orchestrator_connection.log_trace(f"Element status updated to {'failed' if failed else 'succeeded'} in status journal")
+
+
+def materialize_statuses(excel_filename: str) -> None:
+    """Write the statuses from the status journal to the Excel file."""
+    statuses = status_journal.read_statuses(excel_filename)
+    if not statuses:
+        return
 
-    with pd.ExcelWriter(file_to_read, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
+    file_to_read = os.path.join(PATH, excel_filename)
+    with EXCEL_LOCK:
+        df = pd.read_excel(file_to_read, engine='openpyxl')
+        status_table = StatusTable(df)
+        status_table.apply(statuses)
 
-    execute_stored_procedure(
-        connection_string,
-        "journalizing.sp_update_status",
-        db_status
-    )
-    orchestrator_connection.log_trace(f"Element status updated to {'failed' if failed else 'succeeded'} in Excel file")
+        with pd.ExcelWriter(file_to_read, engine='openpyxl') as writer:
+            status_table.to_dataframe().to_excel(writer, index=False)
 
 
 def ensure_columns(df: pd.DataFrame):
@@ -46,13 +64,37 @@ def ensure_columns(df: pd.DataFrame):
     return df
 
 
-def update_dataframe(df: pd.DataFrame, uuid, failed):
-    """Update the dataframe with the status of the element."""
-    df.loc[df['uuid'] == uuid, 'behandlet_fejl' if failed else 'behandlet_ok'] = 'x'
-    if not failed:
-        df.loc[df['uuid'] == uuid, 'behandlet_fejl'] = ' '
-    else:
-        df.loc[df['uuid'] == uuid, 'behandlet_ok'] = ' '
+class StatusTable:
+    """The status columns of an Excel sheet, indexed by uuid.
+
+    The index is built once, so setting the status of an element costs the same
+    no matter how many rows the sheet has.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = ensure_columns(df)
+        self._rows = self._df.groupby('uuid', sort=False).indices
+        self._fejl = self._df['behandlet_fejl'].to_numpy(dtype=object, copy=True)
+        self._ok = self._df['behandlet_ok'].to_numpy(dtype=object, copy=True)
+
+    def set_status(self, uuid, failed: bool) -> None:
+        """Mark the rows of the element as failed or succeeded. Unknown uuids are ignored."""
+        rows = self._rows.get(uuid)
+        if rows is None:
+            return
+        self._fejl[rows] = 'x' if failed else ' '
+        self._ok[rows] = ' ' if failed else 'x'
+
+    def apply(self, statuses: dict) -> None:
+        """Set the statuses of a dict of uuid: failed."""
+        for uuid, failed in statuses.items():
+            self.set_status(uuid, failed)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Return the sheet with the updated status columns."""
+        self._df['behandlet_fejl'] = self._fejl
+        self._df['behandlet_ok'] = self._ok
+        return self._df
 
 
 def get_status_params(form_id: str):
@@ -0,0 +1,71 @@
+"""This module contains the locators of the OPUS pages the robot works with.
+
+Each field is defined once, by the frames it is in and an XPath relative to a container.
+When OPUS changes its layout, this is the place to fix it.
+"""
+from typing import NamedTuple
+
+PORTAL_FRAMES = ()
+FORM_FRAMES = ("contentAreaFrame", "ivuFrm_page0ivu0")
+POPUP_FRAMES = ("URLSPW-0",)
+
+
+class Container(NamedTuple):
+    """An element other locators are relative to. parent is the name of another container, or None."""
+    frames: tuple[str, ...]
+    parent: str | None
+    xpath: str
+
+
+class Locator(NamedTuple):
+    """A field or button, located by an XPath relative to a container, or absolute if container is None."""
+    frames: tuple[str, ...]
+    container: str | None
+    xpath: str
+
+
+CONTAINERS = {
+    "page": Container(FORM_FRAMES, None, "/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody"),
+    "form_body": Container(FORM_FRAMES, "page", "tr[2]/td/div/div/table/tbody/tr[2]/td/table/tbody/tr/td/div/div[1]/div/div/div/table/tbody"),
+    "fields": Container(FORM_FRAMES, "form_body", "tr[1]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody"),
+    "side_panel": Container(FORM_FRAMES, "form_body", "tr[1]/td/div/div/table/tbody/tr/td[2]/table/tbody/tr/td/div/table/tbody"),
+    "popup": Container(POPUP_FRAMES, None, "/html/body/table/tbody/tr/td/div/div[1]/div"),
+}
+
+LOCATORS = {
+    # Portal navigation
+    "min_oekonomi": Locator(PORTAL_FRAMES, None, "//div[text()='Min Økonomi']"),
+    "bilag_og_fakturaer": Locator(PORTAL_FRAMES, None, "//div[text()='Bilag og fakturaer']"),
+    "opret_udgiftsbilag": Locator(PORTAL_FRAMES, None, "/html/body/div[1]/table/tbody/tr[1]/td/div/div[1]/div[9]/div[2]/span[2]"),
+
+    # Form fields
+    "kreditor": Locator(FORM_FRAMES, "fields", "tr[2]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr[1]/td[2]/div/div/table/tbody/tr/td[1]/span/input"),
+    "hent": Locator(FORM_FRAMES, "fields", "tr[2]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr[1]/td[2]/div/div/table/tbody/tr/td[2]/div"),
+    "udbetalingstekst": Locator(FORM_FRAMES, "fields", "tr[3]/td/div/div/table/tbody/tr[1]/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody/tr[1]/td[2]/span/input"),
+    "udbetalingstekst_linjer": Locator(FORM_FRAMES, "fields", "tr[3]/td/div/div/table/tbody/tr[1]/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody/tr[1]/td[3]/div"),
+    "posteringstekst": Locator(FORM_FRAMES, "fields", "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]/td[2]/span/input"),
+    "reference": Locator(FORM_FRAMES, "fields", "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[3]/td[2]/span/input"),
+    "beloeb": Locator(FORM_FRAMES, "fields", "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[4]/td[2]/div/div/table/tbody/tr/td[1]/span/input"),
+    "naeste_agent": Locator(FORM_FRAMES, "fields", "tr[4]/td/div/div/table/tbody/tr[2]/td[2]/div/div/table/tbody/tr[1]/td[1]/span/input"),
+    "kommentar": Locator(FORM_FRAMES, "side_panel", "tr[1]/td/div/div/div/div/table/tbody/tr[2]/td/div/textarea"),
+    "vedhaeft_nyt": Locator(FORM_FRAMES, "side_panel", "tr[3]/td/div/span/span/div/span/span[1]/table/thead/tr[2]/th/div/div/div/span/div"),
+    "artskonto": Locator(FORM_FRAMES, "form_body", (
+        "tr[2]/td/div/span/span[1]/div/span/span[1]/div/div/div/span/span/table/tbody/tr[2]/td/div/table/tbody/tr/td/div/table/tbody"
+        "/tr[1]/td/table/tbody/tr[2]/td[3]/table/tbody/tr/td/span"
+    )),
+    "kontroller": Locator(FORM_FRAMES, "page", "tr[1]/td/div/div[2]/div/div/div/span[4]/div"),
+    "opret": Locator(FORM_FRAMES, "page", "tr[1]/td/div/div[2]/div/div/div/span[1]/div"),
+
+    # Attachment popup
+    "vaelg_fil_input": Locator(POPUP_FRAMES, "popup", "div[3]/table/tbody/tr/td/div/div/span/span[2]/form//input[@type='file']"),
+    "popup_ok": Locator(POPUP_FRAMES, "popup", "div[4]/div/table/tbody/tr/td[3]/table/tbody/tr/td[1]/div"),
+}
+
+
+def absolute_xpath(name: str) -> str:
+    """Return the absolute XPath of a locator or container, e.g. for logging."""
+    locator = LOCATORS.get(name) or CONTAINERS[name]
+    parent = locator.container if isinstance(locator, Locator) else locator.parent
+    if parent is None:
+        return locator.xpath
+    return f"{absolute_xpath(parent)}/{locator.xpath}"
@@ -0,0 +1,97 @@
+"""This module contains the logic for saving a logged-in OPUS session and restoring it in a new browser.
+
+Sessions are encrypted with the OpenOrchestrator key and kept in config.OPUS_SESSION_PATH,
+one file per user, so a restarted browser does not have to go through the full login.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from robot_framework import config
+from robot_framework.subprocesses.cpr_encryption import get_encryptor
+
+_STORAGE_SCRIPT = "return [JSON.stringify(window.localStorage), JSON.stringify(window.sessionStorage)];"
+_RESTORE_STORAGE_SCRIPT = """
+var stored = [JSON.parse(arguments[0]), JSON.parse(arguments[1])];
+[window.localStorage, window.sessionStorage].forEach(function (storage, i) {
+    Object.keys(stored[i]).forEach(function (key) { storage.setItem(key, stored[i][key]); });
+});
+"""
+
+
+def enabled() -> bool:
+    """Check if sessions are saved."""
+    return bool(config.OPUS_SESSION_PATH)
+
+
+def session_path(username: str) -> str:
+    """Return the path of the saved session of a user. The file name does not reveal the username."""
+    name = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(config.OPUS_SESSION_PATH, f"{name}.session")
+
+
+def save(browser, username: str) -> None:
+    """Save the cookies of all domains and the storage of the current page of a logged-in browser."""
+    if not enabled():
+        return
+
+    local_storage, session_storage = browser.execute_script(_STORAGE_SCRIPT)
+    state = {
+        "saved_at": time.time(),
+        "url": browser.current_url,
+        "cookies": browser.execute_cdp_cmd("Network.getAllCookies", {})["cookies"],
+        "local_storage": local_storage,
+        "session_storage": session_storage,
+    }
+
+    os.makedirs(config.OPUS_SESSION_PATH, exist_ok=True)
+    path = session_path(username)
+    part_path = f"{path}.{threading.get_ident()}.part"  # Workers may save at the same time
+    with open(part_path, "wb") as f:
+        f.write(get_encryptor().encrypt(json.dumps(state)))
+    os.replace(part_path, path)
+
+
+def restore(browser, username: str) -> bool:
+    """Load the saved session of a user into a new browser and open the page it was saved on.
+
+    Returns:
+        bool: False if there is no saved session, or it is too old or cannot be decrypted.
+            It is up to the caller to check that the restored session is still logged in.
+    """
+    state = _load(username)
+    if state is None:
+        return False
+
+    browser.execute_cdp_cmd("Network.setCookies", {"cookies": state["cookies"]})
+    browser.get(state["url"])
+    if state["local_storage"] != "{}" or state["session_storage"] != "{}":
+        browser.execute_script(_RESTORE_STORAGE_SCRIPT, state["local_storage"], state["session_storage"])
+        browser.refresh()
+    return True
+
+
+def discard(username: str) -> None:
+    """Delete the saved session of a user, e.g. when it has expired."""
+    if enabled() and os.path.exists(session_path(username)):
+        os.remove(session_path(username))
+
+
+def _load(username: str) -> dict | None:
+    if not enabled() or not os.path.exists(session_path(username)):
+        return None
+
+    try:
+        with open(session_path(username), "rb") as f:
+            state = json.loads(get_encryptor().decrypt(f.read()))
+    except ValueError:
+        # Saved with another key, or damaged
+        discard(username)
+        return None
+
+    if time.time() - state["saved_at"] > config.OPUS_SESSION_MAX_AGE:
+        discard(username)
+        return None
+    return state
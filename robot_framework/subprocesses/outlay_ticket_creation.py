@@ -1,21 +1,127 @@
 """This module contains the logic for creating an outlay ticket in OPUS."""
 import json
 import os
+import threading
 import time
-from pynput.keyboard import Key, Controller
-from mbu_dev_shared_components.utils.fernet_encryptor import Encryptor
+import weakref
 from selenium import webdriver
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    ElementNotInteractableException,
+    NoSuchFrameException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.keys import Keys
 
+from robot_framework import config
 from robot_framework.exceptions import BusinessError
+from robot_framework.subprocesses import opus_session
+from robot_framework.subprocesses.cpr_encryption import get_encryptor
+from robot_framework.subprocesses.opus_locators import CONTAINERS, FORM_FRAMES, LOCATORS, POPUP_FRAMES, PORTAL_FRAMES
+
+# Records the duration of every wait on the current thread, see wait_for
+_wait_log = threading.local()
+
+# The OpusPage of each browser, kept between elements
+_pages = weakref.WeakKeyDictionary()
+
+OPUS_PORTAL_URL = "https://portal.kmd.dk/irj/portal"
+
+# Installs a MutationObserver in the current frame that keeps the time of the latest DOM change
+_DOM_QUIET_SCRIPT = """
+if (window.__lastDomChange === undefined) {
+    window.__lastDomChange = Date.now();
+    new MutationObserver(function () { window.__lastDomChange = Date.now(); })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+}
+return [document.readyState, Date.now() - window.__lastDomChange];
+"""
+
+
+def initialize_browser(opus_username, opus_password, profile=None):
+    """Initialize the Selenium Chrome WebDriver.
+
+    Args:
+        profile (optional): The Chrome profile, "default" or "performance". Defaults to config.BROWSER_PROFILE.
+    """
+    profile = profile or config.BROWSER_PROFILE
+    start = time.perf_counter()
+
+    if profile == "performance":
+        browser = webdriver.Chrome(options=performance_chrome_options())
+        # Images, fonts and analytics are never requested
+        browser.execute_cdp_cmd("Network.enable", {})
+        browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(config.BROWSER_BLOCKED_URLS)})
+    elif profile == "default":
+        browser = webdriver.Chrome(options=default_chrome_options())
+    else:
+        raise ValueError(f"Unknown browser profile: {profile}")
+
+    started = time.perf_counter()
+    if restore_opus_session(browser, opus_username):
+        login = "restored the saved session"
+    else:
+        login_to_opus(browser, opus_username, opus_password)
+        save_opus_session(browser, opus_username)
+        login = "logged in"
+    print(f"Browser started with the {profile} profile in {started - start:.1f}s and {login} in {time.perf_counter() - started:.1f}s.")
 
+    return browser
+
+
+def save_opus_session(browser, opus_username):
+    """Save the session of a browser that has just logged in. See opus_session."""
+    if not (opus_session.enabled() and is_logged_in(browser)):
+        return
+    try:
+        opus_session.save(browser, opus_username)
+    except (OSError, WebDriverException) as e:
+        # The next browser logs in instead
+        print(f"The OPUS session could not be saved: {e}")
+
+
+def restore_opus_session(browser, opus_username) -> bool:
+    """Restore the saved OPUS session of the user, if it is still logged in. See opus_session."""
+    try:
+        if not opus_session.restore(browser, opus_username):
+            return False
+    except WebDriverException as e:
+        print(f"The OPUS session could not be restored: {e}")
+        opus_session.discard(opus_username)
+        return False
+    if is_logged_in(browser):
+        return True
+    opus_session.discard(opus_username)  # The session has expired on the server
+    browser.delete_all_cookies()
+    return False
+
+
+def is_logged_in(browser) -> bool:
+    """Check if the current page is the portal behind the login, by which appears first:
+    the portal navigation or the login form.
+    """
+    def portal_or_login(driver):
+        if driver.find_elements(By.ID, 'logonuidfield'):
+            return "login"
+        if driver.find_elements(By.XPATH, LOCATORS["min_oekonomi"].xpath):
+            return "portal"
+        return False
+
+    try:
+        return wait_for(browser, portal_or_login, "session probe", config.OPUS_SESSION_PROBE_TIMEOUT) == "portal"
+    except TimeoutException:
+        return False
 
-def initialize_browser(opus_username, opus_password):
-    """Initialize the Selenium Chrome WebDriver."""
+
+def default_chrome_options():
+    """Chrome options for a visible, maximized incognito window."""
     chrome_options = Options()
     prefs = {
         "safebrowsing.enabled": False
@@ -28,35 +134,222 @@ def initialize_browser(opus_username, opus_password):
     chrome_options.add_argument("--allow-running-insecure-content")
     chrome_options.add_argument("--disable-search-engine-choice-screen")
     chrome_options.add_argument("--incognito")
+    return chrome_options
 
-    browser = webdriver.Chrome(options=chrome_options)
-
-    login_to_opus(browser, opus_username, opus_password)
 
-    return browser
+def performance_chrome_options():
+    """Chrome options for a headless browser that loads as little as possible.
 
+    Incognito is left out since it disables the disk cache. Chrome still starts from a new,
+    temporary profile, so no cookies or history are kept between browsers.
+    """
+    chrome_options = Options()
+    prefs = {
+        "safebrowsing.enabled": False,
+        "profile.managed_default_content_settings.images": 2,
+    }
 
-def click_element_with_retries(browser, by, value, retries=4):
-    """Click an element with retries and handle common exceptions."""
-    for attempt in range(retries):
+    chrome_options.add_experimental_option("prefs", prefs)
+    chrome_options.add_argument("test-type")
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--disable-web-security")
+    chrome_options.add_argument("--allow-running-insecure-content")
+    chrome_options.add_argument("--disable-search-engine-choice-screen")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-component-update")
+    chrome_options.add_argument("--disable-default-apps")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--no-first-run")
+    chrome_options.add_argument("--disable-features=Translate,OptimizationHints,MediaRouter")
+    # Browsers running at the same time must not share a cache folder
+    cache_path = os.path.join(config.BROWSER_CACHE_PATH, threading.current_thread().name)
+    chrome_options.add_argument(f"--disk-cache-dir={cache_path}")
+    return chrome_options
+
+
+def wait_for(browser, condition, name, timeout):
+    """Wait until condition(browser) is truthy and return its value, raising TimeoutException after timeout seconds.
+    The duration of the wait is recorded under name, see start_wait_log.
+    """
+    start = time.perf_counter()
+    try:
+        return WebDriverWait(
+            browser,
+            timeout,
+            poll_frequency=config.OPUS_POLL_SECONDS,
+            ignored_exceptions=(StaleElementReferenceException,),
+        ).until(condition)
+    finally:
+        _record_wait(name, time.perf_counter() - start)
+
+
+def _record_wait(name, duration):
+    if hasattr(_wait_log, "waits"):
+        _wait_log.waits.append((name, duration))
+
+
+def start_wait_log():
+    """Start recording the waits of the current thread."""
+    _wait_log.waits = []
+
+
+def stop_wait_log() -> list[tuple[str, float]]:
+    """Stop recording and return the (name, seconds) of each wait since start_wait_log."""
+    return _wait_log.__dict__.pop("waits", [])
+
+
+def dom_settled(settle_ms):
+    """Condition that the current frame has finished loading and its DOM has not changed for settle_ms."""
+    def condition(driver):
+        ready_state, quiet_ms = driver.execute_script(_DOM_QUIET_SCRIPT)
+        return ready_state == "complete" and quiet_ms >= settle_ms
+    return condition
+
+
+def wait_until_settled(browser, name):
+    """Wait for OPUS to finish updating the current frame after a round trip to the server.
+
+    If the frame keeps changing for config.OPUS_SETTLE_TIMEOUT, e.g. from a heartbeat, this is
+    recorded as "<name> not settled" in the wait log and the flow goes on, like after a fixed sleep.
+    """
+    try:
+        wait_for(browser, dom_settled(config.OPUS_SETTLE_MS), name, config.OPUS_SETTLE_TIMEOUT)
+    except TimeoutException:
+        _record_wait(f"{name} not settled", 0.0)
+        print(f"OPUS did not settle within {config.OPUS_SETTLE_TIMEOUT}s after {name}, continuing.")
+
+
+def text_present(text):
+    """Condition that an element containing text is in the current frame."""
+    return lambda driver: driver.find_elements(By.XPATH, f"//*[contains(text(), '{text}')]")
+
+
+def click_element_with_retries(browser, by, value, timeout=None):
+    """Click an element as soon as it is clickable, retrying while it is covered or re-rendered.
+
+    Returns:
+        bool: False if the element could not be clicked within timeout, or config.OPUS_CLICK_TIMEOUT, seconds.
+    """
+    return click_when_clickable(browser, lambda driver: driver.find_element(by, value), value, timeout)
+
+
+def click_when_clickable(browser, find, name, timeout=None):
+    """Click the element returned by find(browser) as soon as it is clickable. See click_element_with_retries."""
+    def click(driver):
+        element = find(driver)
+        if not (element.is_displayed() and element.is_enabled()):
+            return False
+        element.click()
+        return True
+
+    start = time.perf_counter()
+    try:
+        return WebDriverWait(
+            browser,
+            timeout or config.OPUS_CLICK_TIMEOUT,
+            poll_frequency=config.OPUS_POLL_SECONDS,
+            ignored_exceptions=(ElementClickInterceptedException, ElementNotInteractableException, StaleElementReferenceException),
+        ).until(click)
+    except TimeoutException as e:
+        print(f"Clicking {name} failed: {e}")
+        return False
+    finally:
+        _record_wait(f"click {name}", time.perf_counter() - start)
+
+
+class OpusPage:
+    """A browser on OPUS, working with the fields in opus_locators by name.
+
+    The current frame is tracked, so the browser only switches frames when a field is in another
+    frame. Containers are looked up once and reused until OPUS re-renders them or the page is left.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.frames = None  # Unknown
+        self.form_submitted = False  # True when the browser is on a form that was just created
+        self._containers = {}
+
+    @classmethod
+    def of(cls, browser) -> "OpusPage":
+        """Return the OpusPage of a browser, creating it the first time."""
+        if browser not in _pages:
+            _pages[browser] = cls(browser)
+        return _pages[browser]
+
+    def reset(self):
+        """Forget the current frame and containers, e.g. after navigating."""
+        self.frames = None
+        self._containers.clear()
+
+    def switch_to(self, frames: tuple[str, ...], timeout=30):
+        """Switch to a frame, given as the path of frame ids from the top document, unless already there."""
+        if self.frames == frames:
+            return
+        # Unknown until the whole path is switched, in case a frame in it doesn't load
+        self.frames = None
+        self.browser.switch_to.default_content()
+        for frame in frames:
+            switch_to_frame(self.browser, frame, timeout)
+        self.frames = frames
+
+    def find(self, name, timeout=30):
+        """Wait for the element of a locator to be present and return it."""
+        locator = LOCATORS[name]
+        return wait_for(self.browser, lambda _: self._resolve(locator), f"element {name}", timeout)
+
+    def click(self, name) -> bool:
+        """Wait for the element of a locator to be clickable, then click it."""
+        self.find(name, 50)
+        return click_when_clickable(self.browser, lambda _: self._resolve(LOCATORS[name]), name)
+
+    def enter_text(self, name, text):
+        """Enter text into the element of a locator."""
+        self.find(name).send_keys(text)
+
+    def locate(self, name, frame_timeout=30):
+        """Find the element of a locator without waiting for it, but waiting up to frame_timeout for its frame.
+        Returns False if the frame was reloaded.
+        """
+        return self._resolve(LOCATORS[name], frame_timeout)
+
+    def _resolve(self, locator, frame_timeout=30):
+        """Find the element of a locator, switching frame if needed."""
         try:
-            element = WebDriverWait(browser, 2).until(
-                EC.element_to_be_clickable((by, value))
-            )
-            element.click()
-            return True
-        except Exception as e:  # pylint: disable=broad-except
-            print(f"Attempt {attempt + 1} failed: {e}")
-            time.sleep(1)
-    return False
+            self.switch_to(locator.frames, frame_timeout)
+            if locator.container is None:
+                return self.browser.find_element(By.XPATH, locator.xpath)
+            return self._find_in_container(locator.container, locator.xpath)
+        except NoSuchFrameException:
+            self.reset()  # The frame was reloaded
+            return False
+
+    def _find_in_container(self, container_name, xpath):
+        container = self._container(container_name)
+        try:
+            return container.find_element(By.XPATH, f"./{xpath}")
+        except StaleElementReferenceException:
+            # OPUS re-rendered the container, it is looked up again on the next try
+            self._containers.clear()
+            raise
+
+    def _container(self, name):
+        if name not in self._containers:
+            container = CONTAINERS[name]
+            if container.parent is None:
+                self._containers[name] = self.browser.find_element(By.XPATH, container.xpath)
+            else:
+                self._containers[name] = self._find_in_container(container.parent, container.xpath)
+        return self._containers[name]
 
 
 def decrypt_cpr(element_data):
-    """Decrypt the CPR number from the element data."""
-    encryptor = Encryptor()
+    """Decrypt the CPR number from the element data with the shared encryptor, see cpr_encryption.get_encryptor."""
     encrypted_cpr = element_data['cpr_encrypted']
 
-    return encryptor.decrypt(encrypted_cpr.encode('utf-8'))
+    return get_encryptor().decrypt(encrypted_cpr.encode('utf-8'))
 
 
 def handle_opus(queue_element, path, browser, orchestrator_connection):
@@ -65,222 +358,188 @@ def handle_opus(queue_element, path, browser, orchestrator_connection):
     element_data = json.loads(queue_element.data)
     attachment_path = os.path.join(path, f'receipt_{element_data["uuid"]}.pdf')
 
-    navigate_to_opus(browser)
-    fill_form(browser, element_data)
-    upload_attachment(browser, attachment_path)
+    page = OpusPage.of(browser)
+    start = time.perf_counter()
+    start_wait_log()
+    try:
+        open_form(page, orchestrator_connection)
+        fill_form(page, element_data)
+        upload_attachment(page, attachment_path)
 
-    complete_form_and_submit(browser, element_data)
+        complete_form_and_submit(page, element_data)
+        page.form_submitted = True
+    finally:
+        log_waits(orchestrator_connection, stop_wait_log(), time.perf_counter() - start)
 
     orchestrator_connection.log_trace("Successfully created outlay ticket.")
     print("Successfully created outlay ticket.")
 
 
+def log_waits(orchestrator_connection, waits, elapsed):
+    """Log the time spent on the element, the time spent waiting and the longest waits."""
+    total = sum(duration for _, duration in waits)
+    longest = sorted(waits, key=lambda wait: wait[1], reverse=True)[:5]
+    orchestrator_connection.log_trace(
+        f"OPUS took {elapsed:.1f}s with the {config.BROWSER_PROFILE} browser profile. "
+        f"Waited {total:.1f}s in {len(waits)} waits. Longest: "
+        + ", ".join(f"{name[:60]} {duration:.1f}s" for name, duration in longest)
+    )
+
+
 def login_to_opus(browser, username, password):
     """Login to OPUS."""
-    browser.get("https://portal.kmd.dk/irj/portal")
+    browser.get(OPUS_PORTAL_URL)
     wait_and_click(browser, By.ID, 'logonuidfield')
     enter_text(browser, By.ID, 'logonuidfield', {username})
     enter_text(browser, By.ID, 'logonpassfield', {password})
     wait_and_click(browser, By.ID, 'buttonLogon')
 
 
-def navigate_to_opus(browser):
+def open_form(page: OpusPage, orchestrator_connection):
+    """Open an empty outlay ticket form.
+
+    If config.OPUS_STAY_ON_FORM is set and the previous element was created on this browser,
+    the new form is opened from the current page. Otherwise, or if that fails, from the portal.
+    """
+    stay_on_form = config.OPUS_STAY_ON_FORM and page.form_submitted
+    page.form_submitted = False
+    if stay_on_form:
+        try:
+            start_new_form(page)
+            return
+        except (TimeoutException, WebDriverException) as e:
+            orchestrator_connection.log_trace(f"Could not open a new form from the current page, navigating from the portal: {e.msg}")
+    navigate_to_opus(page)
+
+
+def start_new_form(page: OpusPage):
+    """Open a new form from the portal navigation that stays next to the form, and wait for it to be empty.
+
+    Raises:
+        TimeoutException: If the navigation entry or the empty form does not appear.
+    """
+    page.switch_to(PORTAL_FRAMES)
+    opret = LOCATORS["opret_udgiftsbilag"]
+    if not click_when_clickable(page.browser, lambda driver: driver.find_element(By.XPATH, opret.xpath), "opret_udgiftsbilag", config.OPUS_NEW_FORM_TIMEOUT):
+        raise TimeoutException("The navigation entry for a new form was not found.")
+
+    def form_is_empty(_):
+        page.reset()  # The form frame is reloaded, so switch to it again on every try
+        try:
+            kreditor = page.locate("kreditor", frame_timeout=config.OPUS_POLL_SECONDS)
+        except TimeoutException:
+            return False  # The frame is not there yet
+        return kreditor and kreditor.get_attribute("value") == ""
+
+    wait_for(page.browser, form_is_empty, "new form", config.OPUS_NEW_FORM_TIMEOUT)
+
+
+def navigate_to_opus(page: OpusPage):
     """Navigate to OPUS page and open required tabs."""
-    browser.get("https://portal.kmd.dk/irj/portal")
-    wait_and_click(browser, By.XPATH, "//div[text()='Min Økonomi']")
-    wait_and_click(browser, By.XPATH, "//div[text()='Bilag og fakturaer']")
-    wait_and_click(browser, By.XPATH, "/html/body/div[1]/table/tbody/tr[1]/td/div/div[1]/div[9]/div[2]/span[2]")
+    start = time.perf_counter()
+    page.browser.get(OPUS_PORTAL_URL)
+    _record_wait("page load portal", time.perf_counter() - start)
+    page.reset()
+    page.click("min_oekonomi")
+    page.click("bilag_og_fakturaer")
+    page.click("opret_udgiftsbilag")
 
 
-def fill_form(browser, element_data):
+def fill_form(page: OpusPage, element_data):
     """Fill out the form with data from element_data."""
-    browser.switch_to.default_content()
-    switch_to_frame(browser, 'contentAreaFrame')
-    switch_to_frame(browser, 'ivuFrm_page0ivu0')
-    root_xpath = "/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]/td/table/tbody/tr/td/div/div[1]/div/div/div/table/tbody/tr[1]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody/"
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[2]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr[1]/td[2]/div/div/table/tbody/tr/td[1]/span/input",
-        decrypt_cpr(element_data),
-    )  # Kreditor
-    wait_and_click(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[2]/td/div/div/table/tbody/tr/td[1]/div/div/table/tbody/tr[1]/td[2]/div/div/table/tbody/tr/td[2]/div",
-    )  # Hent button
-    errorbox = browser.find_elements(By.ID, "WD0324")
+    page.enter_text("kreditor", decrypt_cpr(element_data))
+    page.click("hent")
+    # Check creditor exists
+    wait_until_settled(page.browser, "creditor lookup")
+    errorbox = page.browser.find_elements(By.ID, "WD0324")
     if len(errorbox) > 0 and errorbox[0].text == 'Kreditoren kunne ikke oprettes automatisk. Det ikke er et SE/CVR eller CPR nummer.':
         raise BusinessError("Kreditoren ikke oprettet.")
-    # Check creditor exists
-    time.sleep(3)
-
-    enter_text(
-        browser,
-        By.XPATH,
-        ("/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]"
-         "/td/table/tbody/tr/td/div/div[1]/div/div/div/table/tbody/tr[1]/td/div/div/table/tbody/tr/td[2]/table/tbody/tr/td/div/table/"
-         "tbody/tr[1]/td/div/div/div/div/table/tbody/tr[2]/td/div/textarea"),
-        element_data['evt_kommentar'] if str(element_data['evt_kommentar']) != "nan" else ""
-    )  # Kommentar
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[3]/td/div/div/table/tbody/tr[1]/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody/tr[1]/td[2]/span/input",
-        element_data["posteringstekst"],
-    )  # Udbetalingstekst
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]/td[2]/span/input",
-        element_data["posteringstekst"],
-    )  # Posteringstekst
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[3]/td[2]/span/input",
-        element_data["reference"],
-    )  # Reference
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[3]/td/div/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[4]/td[2]/div/div/table/tbody/tr/td[1]/span/input",
-        element_data["beloeb"],
-    )  # Beløb
-    enter_text(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[4]/td/div/div/table/tbody/tr[2]/td[2]/div/div/table/tbody/tr[1]/td[1]/span/input",
-        element_data["naeste_agent"],
-    )  # Næste agent
+
+    page.enter_text("kommentar", element_data['evt_kommentar'] if str(element_data['evt_kommentar']) != "nan" else "")
+    page.enter_text("udbetalingstekst", element_data["posteringstekst"])
+    page.enter_text("posteringstekst", element_data["posteringstekst"])
+    page.enter_text("reference", element_data["reference"])
+    page.enter_text("beloeb", element_data["beloeb"])
+    page.enter_text("naeste_agent", element_data["naeste_agent"])
 
     # Click item next to "udbeatlingstekst" to add column with child name
-    wait_and_click(
-        browser,
-        By.XPATH,
-        root_xpath + "tr[3]/td/div/div/table/tbody/tr[1]/td[1]/div/div/table/tbody/tr/td/div/div/table/tbody/tr[1]/td[3]/div",
-    )
-    browser.switch_to.default_content()  # Popup is not appearing on current frame
-    switch_to_frame(browser, "URLSPW-0")  # Switch to popup
+    page.click("udbetalingstekst_linjer")
+    page.switch_to(POPUP_FRAMES)  # Popup is not appearing on current frame
     # Type text at cursor (element id is dynamic but cursor always starts at next empty line)
-    actions = ActionChains(browser)
+    actions = ActionChains(page.browser)
     actions.send_keys(element_data["barnets_navn"])
     actions.perform()
     # Click "Gem"
     # Find all buttons in frame:
-    buttons = browser.find_elements(By.CLASS_NAME, "lsButton")
+    buttons = page.browser.find_elements(By.CLASS_NAME, "lsButton")
     # Search and click on "gem"
     for button in buttons:
         if button.text.lower() == "gem":
             button.click()
     # Back to previous frame
-    browser.switch_to.default_content()
-    switch_to_frame(browser, "contentAreaFrame")
-    switch_to_frame(browser, "ivuFrm_page0ivu0")
+    page.switch_to(FORM_FRAMES)
 
 
-def upload_attachment(browser, attachment_path):
+def upload_attachment(page: OpusPage, attachment_path):
     """Upload the attachment file to the browser form."""
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]/td/table/tbody/tr/td/div/div[1]/div/div/div/table/tbody/tr[1]/td/div/div/table/tbody/tr/td[2]/table/tbody/tr/td/div/table/tbody/tr[3]/td/div/span/span/div/span/span[1]/table/thead/tr[2]/th/div/div/div/span/div')  # Click 'Vedhæft nyt' button
-    WebDriverWait(browser, 20).until(
-        lambda driver: driver.execute_script("return document.readyState") == "complete"
+    page.click("vedhaeft_nyt")
+    wait_for(
+        page.browser,
+        lambda driver: driver.execute_script("return document.readyState") == "complete",
+        "attachment popup load",
+        20,
     )
-    browser.switch_to.default_content()
-    switch_to_frame(browser, 'URLSPW-0')
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/div[1]/div/div[3]/table/tbody/tr/td/div/div/span/span[2]/form')  # Click 'Vælg fil' button
-
-    time.sleep(4)
-    keyboard = Controller()
-    keyboard.type(attachment_path)
-    time.sleep(2)
-    keyboard.press(Key.enter)
-    keyboard.release(Key.enter)
-    time.sleep(2)
+    # The path is given to the file input behind 'Vælg fil' directly, instead of through the file dialog
+    page.find("vaelg_fil_input").send_keys(os.path.abspath(attachment_path))
+    wait_until_settled(page.browser, "attachment selected")
 
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/div[1]/div/div[4]/div/table/tbody/tr/td[3]/table/tbody/tr/td[1]/div')  # Click 'OK' button
-    time.sleep(2)
+    page.click("popup_ok")
+    page.switch_to(PORTAL_FRAMES)
+    wait_for(page.browser, EC.invisibility_of_element_located((By.ID, 'URLSPW-0')), "attachment popup close", config.OPUS_SETTLE_TIMEOUT)
 
 
-def press_key(keyboard, key):
-    """Press and release a key on the keyboard."""
-    keyboard.press(key)
-    keyboard.release(key)
-
-
-def complete_form_and_submit(browser, element_data):
+def complete_form_and_submit(page: OpusPage, element_data):
     """Complete the form and submit the ticket."""
+    page.click("artskonto")
+    # The posting line cells are rendered as inputs when focused, so they are filled by tabbing from Artskonto.
+    # The keys are sent through WebDriver, so the browser does not need focus on the desktop.
+    actions = ActionChains(page.browser)
+    actions.send_keys(element_data['arts_konto'])  # Artskonto
+    actions.send_keys(Keys.TAB, element_data['beloeb'])  # Beløb
+    actions.send_keys(Keys.TAB, Keys.TAB, Keys.TAB, element_data['psp'])  # PSP
+    actions.send_keys(Keys.TAB, element_data['posteringstekst'])  # Posteringstekst
+    actions.perform()
 
-    browser.switch_to.default_content()
-    switch_to_frame(browser, 'contentAreaFrame')
-    switch_to_frame(browser, 'ivuFrm_page0ivu0')
-
-    keyboard = Controller()
-
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[2]/td/div/div/table/tbody/tr[2]/td/table/tbody/tr/td/div/div[1]/div/div/div/table/tbody/tr[2]/td/div/span/span[1]/div/span/span[1]/div/div/div/span/span/table/tbody/tr[2]/td/div/table/tbody/tr/td/div/table/tbody/tr[1]/td/table/tbody/tr[2]/td[3]/table/tbody/tr/td/span')
-    keyboard.type(element_data['arts_konto'])  # Artskonto
-
-    press_key(keyboard, Key.tab)
-    keyboard.type(element_data['beloeb'])  # Beløb
-
-    press_key(keyboard, Key.tab)
-    press_key(keyboard, Key.tab)
-    press_key(keyboard, Key.tab)
-    keyboard.type(element_data['psp'])  # PSP
-
-    press_key(keyboard, Key.tab)
-    keyboard.type(element_data['posteringstekst'])  # Posteringstekst
-
-    time.sleep(1)
-
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[1]/td/div/div[2]/div/div/div/span[4]/div')  # Click 'Kontroller' button
-    time.sleep(4)
-
-    # # Check for business error here
-    # if not browser.find_elements(By.XPATH, "//*[contains(text(), 'Udgiftsbilag er kontrolleret og OK')]"):
-    #     raise BusinessError("Fejl ved kontrol af udgiftsbilag.")
-
-    # Then retry every 1 second for up to 10 seconds
-    max_retries = 10
-    found = False
-
-    for _ in range(max_retries):
-        if browser.find_elements(
-            By.XPATH,
-            "//*[contains(text(), 'Udgiftsbilag er kontrolleret og OK')]"
-        ):
-            found = True
-            break
-
-        time.sleep(1)
+    wait_until_settled(page.browser, "posting line entered")
 
-    print()
+    page.click("kontroller")
 
-    # Business error if never found
-    if not found:
-        raise BusinessError("Fejl ved kontrol af udgiftsbilag.")
+    # Business error if the check never reports OK
+    try:
+        wait_for(page.browser, text_present('Udgiftsbilag er kontrolleret og OK'), "Kontroller result", config.OPUS_RESULT_TIMEOUT)
+    except TimeoutException as e:
+        raise BusinessError("Fejl ved kontrol af udgiftsbilag.") from e
 
-    wait_and_click(browser, By.XPATH, '/html/body/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr/td/div/table/tbody/tr[1]/td/div/div[2]/div/div/div/span[1]/div')  # Click 'Opret' button
-    time.sleep(4)
-    if not browser.find_elements(By.XPATH, "//*[contains(text(), 'er oprettet')]"):
-        time.sleep(1)
-        raise BusinessError("Fejl ved oprettelse af udgiftsbilag, kontrol OK.")
+    page.click("opret")
+    try:
+        wait_for(page.browser, text_present('er oprettet'), "Opret result", config.OPUS_RESULT_TIMEOUT)
+    except TimeoutException as e:
+        raise BusinessError("Fejl ved oprettelse af udgiftsbilag, kontrol OK.") from e
 
 
-def switch_to_frame(browser, frame):
+def switch_to_frame(browser, frame, timeout=30):
     """Switch to the required frames to access the form."""
-    WebDriverWait(browser, 30).until(EC.frame_to_be_available_and_switch_to_it((By.ID, frame)))
+    wait_for(browser, EC.frame_to_be_available_and_switch_to_it((By.ID, frame)), f"frame {frame}", timeout)
 
 
 def enter_text(browser, by, value, text):
     """Helper to enter text into a form element."""
-    input_element = WebDriverWait(browser, 30).until(
-        EC.presence_of_element_located((by, value))
-    )
+    input_element = wait_for(browser, EC.presence_of_element_located((by, value)), f"input {value}", 30)
     input_element.send_keys(text)
 
 
 def wait_and_click(browser, by, value):
     """Wait for an element to be clickable, then click it."""
 
-    WebDriverWait(browser, 50).until(EC.presence_of_element_located((by, value)))
+    wait_for(browser, EC.presence_of_element_located((by, value)), f"element {value}", 50)
     click_element_with_retries(browser, by, value)
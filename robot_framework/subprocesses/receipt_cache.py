@@ -0,0 +1,219 @@
+"""This module contains a cache of downloaded receipts that survives retries and runs.
+
+Receipts are stored by the SHA-256 of their content, with an index from form uuid to hash.
+A receipt is removed from the cache when its element has been processed (see
+process.remove_attachment_if_exists), when its element is no longer new in the queue at the start
+of a run (see retain), when it is older than config.RECEIPT_CACHE_MAX_AGE_DAYS, or when the least
+recently used receipts are evicted to keep the cache below config.RECEIPT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from robot_framework import config
+
+INDEX_FILENAME = "index.json"
+
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    """Check if the receipt cache is configured."""
+    return bool(config.RECEIPT_CACHE_PATH) and config.RECEIPT_CACHE_MAX_BYTES > 0
+
+
+def get(uuid: str, file_path: str) -> bool:
+    """Copy the cached receipt of a form to file_path.
+
+    Returns:
+        bool: True if the receipt was cached, False if it must be downloaded.
+    """
+    if not enabled():
+        return False
+
+    try:
+        return _get(uuid, file_path)
+    except OSError as e:
+        print(f"Receipt cache could not be read: {e}")
+        return False
+
+
+def _get(uuid: str, file_path: str) -> bool:
+    with _lock:
+        index = _load_index()
+        entry = index.get(uuid)
+        if entry is None:
+            return False
+
+        blob_path = _blob_path(entry["sha256"])
+        if not os.path.exists(blob_path) or _hash_file(blob_path) != entry["sha256"]:
+            # The cached file is missing or damaged
+            del index[uuid]
+            _remove_unreferenced(index, entry["sha256"])
+            _save_index(index)
+            return False
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        part_path = file_path + ".part"
+        shutil.copyfile(blob_path, part_path)
+        os.replace(part_path, file_path)
+
+        entry["used"] = time.time()
+        _save_index(index)
+        return True
+
+
+def put(uuid: str, file_path: str) -> None:
+    """Add a downloaded receipt to the cache and evict the least recently used receipts above the size cap."""
+    if not enabled():
+        return
+
+    try:
+        _put(uuid, file_path)
+    except OSError as e:
+        # The receipt is downloaded again if needed
+        print(f"Receipt could not be added to the cache: {e}")
+
+
+def _put(uuid: str, file_path: str):
+    sha256 = _hash_file(file_path)
+    with _lock:
+        os.makedirs(config.RECEIPT_CACHE_PATH, exist_ok=True)
+        blob_path = _blob_path(sha256)
+        if not os.path.exists(blob_path):
+            part_path = blob_path + ".part"
+            shutil.copyfile(file_path, part_path)
+            os.replace(part_path, blob_path)
+
+        index = _load_index()
+        previous = index.get(uuid)
+        now = time.time()
+        index[uuid] = {"sha256": sha256, "size": os.path.getsize(blob_path), "created": now, "used": now}
+        if previous and previous["sha256"] != sha256:
+            _remove_unreferenced(index, previous["sha256"])
+
+        _evict(index, config.RECEIPT_CACHE_MAX_BYTES)
+        _save_index(index)
+
+
+def discard(uuid: str) -> None:
+    """Remove the receipt of a form from the cache, e.g. when the form has been processed."""
+    if not enabled():
+        return
+
+    try:
+        _discard(uuid)
+    except OSError as e:
+        # The receipt is removed by retain at the start of the next run
+        print(f"Receipt could not be removed from the cache: {e}")
+
+
+def _discard(uuid: str):
+    with _lock:
+        index = _load_index()
+        entry = index.pop(uuid, None)
+        if entry is not None:
+            _remove_unreferenced(index, entry["sha256"])
+            _save_index(index)
+
+
+def retain(uuids: set[str]) -> int:
+    """Remove the receipts of all forms not in uuids, e.g. the forms that are no longer new in the queue.
+
+    Returns:
+        int: The number of removed receipts.
+    """
+    if not enabled():
+        return 0
+
+    with _lock:
+        index = _load_index()
+        removed = [uuid for uuid in index if uuid not in uuids]
+        for uuid in removed:
+            entry = index.pop(uuid)
+            _remove_unreferenced(index, entry["sha256"])
+        if removed:
+            _save_index(index)
+        return len(removed)
+
+
+def prune() -> int:
+    """Remove receipts older than config.RECEIPT_CACHE_MAX_AGE_DAYS and files not in the index.
+
+    Returns:
+        int: The number of removed receipts.
+    """
+    if not enabled():
+        return 0
+
+    with _lock:
+        index = _load_index()
+        expired_before = time.time() - config.RECEIPT_CACHE_MAX_AGE_DAYS * 24 * 3600
+        expired = [uuid for uuid, entry in index.items() if entry["created"] < expired_before]
+        for uuid in expired:
+            del index[uuid]
+
+        referenced = {entry["sha256"] + ".pdf" for entry in index.values()}
+        if os.path.isdir(config.RECEIPT_CACHE_PATH):
+            for name in os.listdir(config.RECEIPT_CACHE_PATH):
+                if name != INDEX_FILENAME and name not in referenced:
+                    os.remove(os.path.join(config.RECEIPT_CACHE_PATH, name))
+
+        _save_index(index)
+        return len(expired)
+
+
+def _evict(index: dict, max_bytes: int):
+    """Remove the least recently used receipts until the cache is at most max_bytes."""
+    sizes = {entry["sha256"]: entry["size"] for entry in index.values()}
+    total = sum(sizes.values())
+    for uuid in sorted(index, key=lambda u: index[u]["used"]):
+        if total <= max_bytes:
+            return
+        entry = index.pop(uuid)
+        if _remove_unreferenced(index, entry["sha256"]):
+            total -= sizes[entry["sha256"]]
+
+
+def _remove_unreferenced(index: dict, sha256: str) -> bool:
+    """Delete the file of a hash if no form in the index refers to it. Returns True if it was deleted."""
+    if any(entry["sha256"] == sha256 for entry in index.values()):
+        return False
+    blob_path = _blob_path(sha256)
+    if os.path.exists(blob_path):
+        os.remove(blob_path)
+    return True
+
+
+def _blob_path(sha256: str) -> str:
+    return os.path.join(config.RECEIPT_CACHE_PATH, f"{sha256}.pdf")
+
+
+def _hash_file(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(config.RECEIPT_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _load_index() -> dict:
+    index_path = os.path.join(config.RECEIPT_CACHE_PATH, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return {}  # The unreferenced files are removed by prune
+
+
+def _save_index(index: dict):
+    os.makedirs(config.RECEIPT_CACHE_PATH, exist_ok=True)
+    index_path = os.path.join(config.RECEIPT_CACHE_PATH, INDEX_FILENAME)
+    with open(index_path + ".part", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".part", index_path)
@@ -0,0 +1,132 @@
+"""This module contains the logic for downloading the receipts of the queue in bulk before it is processed."""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+from sqlalchemy import Engine
+
+from robot_framework import config
+from robot_framework.cached_connection import invalidate
+from robot_framework.queue_lease import get_new_queue_elements
+from robot_framework.subprocesses import receipt_cache
+from robot_framework.subprocesses.get_os2form_receipt import InvalidReceiptError, os2_headers, receipt_path, save_receipt
+
+
+def download_receipts(orchestrator_connection: OrchestratorConnection, engine: Engine, os2_api_key: str,
+                      limit: int | None = None) -> tuple[int, int]:
+    """Download the receipts of the next new queue elements concurrently.
+
+    Receipts that fail to download are left for fetch_receipt to download when the element is processed.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        engine: An engine on the OpenOrchestrator database, to read the queue in the order it is processed.
+        os2_api_key: The API key for the OS2Forms API.
+        limit (optional): The number of queue elements to download receipts for, in the order they
+            will be processed. Defaults to config.MAX_TASK_COUNT, the number processed in one run.
+
+    Returns:
+        tuple[int, int]: The number of downloaded and failed receipts.
+    """
+    queue_elements = get_new_queue_elements(engine, config.QUEUE_NAME, limit or config.MAX_TASK_COUNT)
+
+    downloads = []
+    uuids = []
+    for queue_element in queue_elements:
+        try:
+            element_data = json.loads(queue_element.data)
+        except (TypeError, ValueError):
+            continue
+        if element_data.get('attachment') and element_data.get('uuid') and element_data.get('filename'):
+            file_path = receipt_path(element_data)
+            if not os.path.exists(file_path) and not receipt_cache.get(element_data['uuid'], file_path):
+                downloads.append((element_data['attachment'], file_path))
+                uuids.append(element_data['uuid'])
+
+    start = time.perf_counter()
+    errors = asyncio.run(download_all(downloads, os2_api_key, config.RECEIPT_DOWNLOAD_CONCURRENCY))
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for uuid, (url, file_path), error in zip(uuids, downloads, errors):
+        if error is None:
+            receipt_cache.put(uuid, file_path)
+            continue
+        failed += 1
+        response = getattr(error, 'response', None)
+        if response is not None and response.status_code in (401, 403):
+            invalidate(orchestrator_connection, config.OS2_API_CREDENTIAL)
+        orchestrator_connection.log_trace(f"Receipt not downloaded, it is fetched when processed: {url}: {error}")
+
+    orchestrator_connection.log_trace(
+        f"Downloaded {len(downloads) - failed} receipts in {elapsed:.1f}s, {failed} failed."
+    )
+    return len(downloads) - failed, failed
+
+
+async def download_all(downloads: list[tuple[str, str]], os2_api_key: str, concurrency: int) -> list[Exception | None]:
+    """Download files concurrently on one pooled session, at most concurrency at a time.
+
+    Args:
+        downloads: (url, file path) of each file.
+        os2_api_key: The API key for the OS2Forms API.
+        concurrency: The maximum number of simultaneous downloads.
+
+    Returns:
+        list: The error of each download that failed after all retries, or None if it succeeded.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # requests is blocking, so each download runs on a thread of its own pool, sized to the concurrency
+    with _create_session(os2_api_key, concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*(
+            _download_with_retry(session, semaphore, executor, url, file_path) for url, file_path in downloads
+        ))
+
+
+def _create_session(os2_api_key: str, pool_size: int) -> requests.Session:
+    """Create a session with the OS2Forms API headers and a connection pool of pool_size."""
+    session = requests.Session()
+    session.headers.update(os2_headers(os2_api_key))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+async def _download_with_retry(session: requests.Session, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor,
+                               url: str, file_path: str) -> Exception | None:
+    """Download a file, retrying with exponential backoff on network errors, invalid files, 429 and 5xx responses."""
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    async with semaphore:
+        while True:
+            try:
+                await loop.run_in_executor(executor, _download, session, url, file_path)
+                return None
+            except (requests.RequestException, InvalidReceiptError, OSError) as error:
+                if attempt == config.RECEIPT_DOWNLOAD_RETRIES or not _is_retryable(error):
+                    return error
+            await asyncio.sleep(config.RECEIPT_DOWNLOAD_BACKOFF * 2 ** attempt)
+            attempt += 1
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, InvalidReceiptError):
+        return True  # Most likely a truncated response
+    if not isinstance(error, requests.RequestException):
+        return False  # Saving the file failed
+    if error.response is None:
+        return True
+    return error.response.status_code == 429 or error.response.status_code >= 500
+
+
+def _download(session: requests.Session, url: str, file_path: str):
+    """Download a receipt to file_path. See save_receipt."""
+    with session.get(url, stream=True, timeout=config.RECEIPT_DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        save_receipt(response, file_path)
@@ -0,0 +1,116 @@
+"""This module contains the logic for downloading receipts ahead of the browser work."""
+import queue
+import threading
+from concurrent.futures import Future
+
+from OpenOrchestrator.database.queues import QueueStatus
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+_END = object()
+
+
+class ReceiptPrefetcher:
+    """Claims upcoming queue elements and downloads their receipts in a background thread.
+
+    Elements are handed out in the order they were claimed, each with a Future holding the
+    folder of its receipt. A failed download is kept in the Future and raised when the
+    element is processed, so the failure is handled the same way as without prefetching.
+    Elements that were claimed but never handed out are set back to 'New' on close.
+    If claiming fails, the error is raised by next, and the next call starts claiming again.
+    """
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, next_queue_element, fetch, lookahead: int):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            next_queue_element: Callable claiming the next queue element, or returning None if the queue is empty.
+            fetch: Callable downloading the receipt of a queue element and returning its folder.
+            lookahead: The number of downloaded elements to keep ready.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self._next_queue_element = next_queue_element
+        self._fetch = fetch
+        self._buffer = queue.Queue(maxsize=lookahead)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start claiming and downloading in the background."""
+        self._thread = threading.Thread(target=self._run, name="receipt_prefetch", daemon=True)
+        self._thread.start()
+
+    def next(self) -> tuple | None:
+        """Return the next (queue element, receipt Future), or None if the queue is empty."""
+        while True:
+            try:
+                item = self._buffer.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    # Claiming failed and the error was raised by an earlier call, so claim again
+                    self.start()
+        if item is _END:
+            self._buffer.put(_END)  # Keep returning None on later calls
+            return None
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self) -> None:
+        """Stop prefetching and release the elements that were claimed but not handed out."""
+        self._stop_event.set()
+        while self._thread.is_alive():
+            self._drain()
+            self._thread.join(timeout=0.1)
+        self._drain()
+
+    def _run(self):
+        """Claim elements and download their receipts until the queue is empty or the prefetcher stops."""
+        try:
+            while not self._stop_event.is_set():
+                queue_element = self._next_queue_element()
+                if queue_element is None:
+                    break
+
+                receipt = Future()
+                try:
+                    receipt.set_result(self._fetch(queue_element))
+                # The error is raised again when the element is processed.
+                # pylint: disable-next = broad-exception-caught
+                except Exception as error:
+                    receipt.set_exception(error)
+
+                if not self._put((queue_element, receipt)):
+                    self._release(queue_element)
+                    return
+
+            self._put(_END)
+
+        # pylint: disable-next = broad-exception-caught
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item) -> bool:
+        """Put an item in the buffer, waiting for room. Returns False if stopped while waiting."""
+        while not self._stop_event.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self):
+        """Empty the buffer and release any elements in it."""
+        while True:
+            try:
+                item = self._buffer.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, tuple):
+                self._release(item[0])
+
+    def _release(self, queue_element):
+        """Set a claimed queue element back to 'New' so it is picked up again."""
+        self.orchestrator_connection.set_queue_element_status(queue_element.id, QueueStatus.NEW)
+        self.orchestrator_connection.log_trace(f"Released prefetched queue element ID: {queue_element.id}")
@@ -0,0 +1,161 @@
+"""This module contains the logic for downloading files from a SharePoint folder."""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mbu_msoffice_integration.sharepoint_class import Sharepoint
+
+from robot_framework import config
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class SharepointFolderClient:
+    """Thin wrapper around Sharepoint that lists file metadata and streams file content."""
+
+    def __init__(self):
+        self.sharepoint = Sharepoint(
+            **config.SHAREPOINT_CREDS,
+            document_library=config.DOCUMENT_LIBRARY,
+            site_url=config.SHAREPOINT_SITE_URL,
+            site_name=config.SHAREPOINT_SITE_NAME,
+        )
+
+    def list_files(self, folder_name: str) -> list[dict]:
+        """List the files in the folder with the metadata used to detect changes."""
+        sharepoint = self.sharepoint
+        folder_url = f"/{sharepoint.site_type}/{sharepoint.site_name}/{sharepoint.document_library}/{folder_name}"
+        files = sharepoint.ctx.web.get_folder_by_server_relative_url(folder_url).files
+        sharepoint.ctx.load(files)
+        sharepoint.ctx.execute_query()
+
+        return [
+            {
+                "Name": file.name,
+                "ServerRelativeUrl": file.server_relative_url,
+                "Length": file.length,
+                "TimeLastModified": str(file.time_last_modified),
+                "ETag": file.properties.get("ETag"),
+            }
+            for file in files
+        ]
+
+    def download_file(self, file_info: dict, file_object) -> None:
+        """Stream the content of the file to the open binary file object."""
+        file = self.sharepoint.ctx.web.get_file_by_server_relative_url(file_info["ServerRelativeUrl"])
+        file.download_session(file_object).execute_query()
+
+
+def download_files(folder_name: str, destination: str, client_factory=SharepointFolderClient,
+                   extension: str = ".xlsx", max_workers: int | None = None) -> list[str]:
+    """Download all files with the given extension from a SharePoint folder to destination.
+
+    Files are downloaded concurrently, each worker thread using its own client, and streamed
+    to disk. A manifest of size, modified time and ETag is kept in destination, so files that
+    have not changed since the last download are not downloaded again.
+
+    Args:
+        folder_name: The SharePoint folder to download from.
+        destination: The local folder to download to.
+        client_factory: Callable returning a client with list_files and download_file methods.
+        extension: Only files with this extension are downloaded.
+        max_workers: The maximum number of concurrent downloads. Defaults to config.SHAREPOINT_DOWNLOAD_WORKERS.
+
+    Returns:
+        list[str]: The names of all matching files, downloaded or unchanged.
+    """
+    os.makedirs(destination, exist_ok=True)
+
+    files = [f for f in client_factory().list_files(folder_name) or [] if f["Name"].endswith(extension)]
+
+    # Prune before anything else, so a file moved off SharePoint is deleted locally even if the folder is now empty
+    manifest_path = os.path.join(destination, MANIFEST_FILENAME)
+    manifest = _load_manifest(manifest_path)
+    if _prune_removed_files(manifest, {file_info["Name"] for file_info in files}, destination):
+        _save_manifest(manifest_path, manifest)
+
+    if not files:
+        print("No files found in the specified SharePoint folder.")
+        return []
+
+    changed_files = []
+    for file_info in files:
+        if _is_unchanged(file_info, manifest.get(file_info["Name"]), destination):
+            print(f"Unchanged, skipping download: {file_info['Name']}")
+        else:
+            changed_files.append(file_info)
+
+    thread_local = threading.local()
+
+    def download(file_info: dict) -> dict:
+        if not hasattr(thread_local, "client"):
+            thread_local.client = client_factory()
+
+        download_path_file = os.path.join(destination, file_info["Name"])
+        temp_path = f"{download_path_file}.part"
+        with open(temp_path, "wb") as local_file:
+            thread_local.client.download_file(file_info, local_file)
+        os.replace(temp_path, download_path_file)
+
+        print(f"Downloaded: {file_info['Name']} to {download_path_file}")
+        return file_info
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or config.SHAREPOINT_DOWNLOAD_WORKERS) as pool:
+            for file_info in pool.map(download, changed_files):
+                manifest[file_info["Name"]] = _manifest_entry(file_info)
+    finally:
+        # Keep the files that did download, even if another one failed
+        _save_manifest(manifest_path, manifest)
+
+    return [file_info["Name"] for file_info in files]
+
+
+def _manifest_entry(file_info: dict) -> dict:
+    """Return the metadata of a file that is stored in the manifest."""
+    return {key: file_info.get(key) for key in ("Length", "TimeLastModified", "ETag")}
+
+
+def _is_unchanged(file_info: dict, entry: dict | None, destination: str) -> bool:
+    """Check if the local copy of a file matches the remote metadata in the manifest."""
+    local_path = os.path.join(destination, file_info["Name"])
+    if entry is None or not os.path.isfile(local_path):
+        return False
+
+    if entry != _manifest_entry(file_info):
+        return False
+
+    return file_info.get("Length") is None or os.path.getsize(local_path) == file_info["Length"]
+
+
+def _prune_removed_files(manifest: dict, remote_names: set[str], destination: str) -> bool:
+    """Delete local copies of files that are no longer in the SharePoint folder.
+
+    Returns:
+        bool: Whether any file was removed from the manifest.
+    """
+    removed_names = set(manifest) - remote_names
+    for name in removed_names:
+        del manifest[name]
+        local_path = os.path.join(destination, name)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+    return bool(removed_names)
+
+
+def _load_manifest(manifest_path: str) -> dict:
+    """Load the download manifest, or an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest_path: str, manifest: dict) -> None:
+    """Write the download manifest atomically."""
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
@@ -0,0 +1,79 @@
+"""This module contains an append-only journal of the processing status of each form."""
+import json
+import os
+import threading
+from datetime import datetime
+
+from robot_framework import config
+
+JOURNAL_SUFFIX = ".status.jsonl"
+
+_lock = threading.Lock()
+_record_counts = {}
+
+
+def journal_path(excel_filename: str) -> str:
+    """Return the path of the journal belonging to an Excel file."""
+    return os.path.join(config.STATUS_JOURNAL_PATH, f"{excel_filename}{JOURNAL_SUFFIX}")
+
+
+def record_status(excel_filename: str, uuid: str, failed: bool) -> int:
+    """Append the status of a form to the journal and flush it to disk.
+
+    Returns:
+        int: The number of statuses recorded for the Excel file by this process.
+    """
+    line = json.dumps({"uuid": uuid, "failed": failed, "time": datetime.now().isoformat()}, ensure_ascii=False)
+
+    with _lock:
+        os.makedirs(config.STATUS_JOURNAL_PATH, exist_ok=True)
+        path = journal_path(excel_filename)
+        if excel_filename not in _record_counts and not _ends_with_newline(path):
+            line = "\n" + line  # Don't append to a line cut short by a crash
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        _record_counts[excel_filename] = _record_counts.get(excel_filename, 0) + 1
+        return _record_counts[excel_filename]
+
+
+def _ends_with_newline(path: str) -> bool:
+    """Check if a file is missing, empty or ends with a newline."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def read_statuses(excel_filename: str) -> dict[str, bool]:
+    """Replay the journal of an Excel file.
+
+    Returns:
+        dict[str, bool]: The latest status of each form uuid, True if it failed.
+    """
+    statuses = {}
+    path = journal_path(excel_filename)
+    if not os.path.exists(path):
+        return statuses
+
+    with _lock, open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            statuses[entry["uuid"]] = entry["failed"]
+
+    return statuses
+
+
+def clear(excel_filename: str) -> None:
+    """Delete the journal of an Excel file once its statuses are no longer needed."""
+    with _lock:
+        _record_counts.pop(excel_filename, None)
+        if os.path.exists(journal_path(excel_filename)):
+            os.remove(journal_path(excel_filename))
@@ -0,0 +1,190 @@
+"""This module contains a background writer for the status updates of the journalizing database."""
+import atexit
+import json
+import queue
+import threading
+import time
+
+import pyodbc
+from dateutil import parser
+
+from robot_framework import config
+
+STATUS_PROCEDURE = "journalizing.sp_update_status"
+
+_writers = {}
+_writers_lock = threading.Lock()
+_CLOSE = object()
+
+
+def get_status_writer(connection_string: str) -> "StatusWriter":
+    """Return the running StatusWriter for the connection string, starting it on first use."""
+    with _writers_lock:
+        if connection_string not in _writers:
+            _writers[connection_string] = StatusWriter(PooledProcedureExecutor(connection_string))
+        return _writers[connection_string]
+
+
+@atexit.register
+def close_status_writers() -> None:
+    """Flush and stop all running StatusWriters."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+class BatchWriteError(Exception):
+    """Raised when some updates of a batch could not be written. failed holds (params, error) of each of them."""
+
+    def __init__(self, failed: list[tuple[dict, Exception]]):
+        super().__init__(f"{len(failed)} updates failed, the first with: {failed[0][1]}")
+        self.failed = failed
+
+
+class PooledProcedureExecutor:
+    """Executes batches of stored procedure calls on one database connection that is kept open."""
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+        self._connection = None
+
+    def __call__(self, stored_procedure: str, batch: list[dict]) -> None:
+        """Execute the stored procedure once per parameter dict and commit them together.
+
+        If the batch fails, the connection is opened again and the updates are retried one at a time,
+        so an update the database rejects does not keep the rest of the batch from being written.
+
+        Raises:
+            BatchWriteError: If some updates still failed.
+        """
+        try:
+            self._execute(stored_procedure, batch)
+            return
+        except pyodbc.Error:
+            self.close()
+
+        failed = []
+        for params in batch:
+            try:
+                self._execute(stored_procedure, [params])
+            except pyodbc.Error as error:
+                self.close()  # Roll back, and connect again in case the connection was what failed
+                failed.append((params, error))
+        if failed:
+            raise BatchWriteError(failed)
+
+    def _execute(self, stored_procedure: str, batch: list[dict]) -> None:
+        if self._connection is None:
+            self._connection = pyodbc.connect(self.connection_string)
+
+        with self._connection.cursor() as cursor:
+            for params in batch:
+                placeholders = ", ".join(f"@{key} = ?" for key in params)
+                values = tuple(_convert_param(value) for value in params.values())
+                cursor.execute(f"EXEC {stored_procedure} {placeholders}", values)
+        self._connection.commit()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except pyodbc.Error:
+                pass
+            self._connection = None
+
+
+def _convert_param(value: tuple):
+    """Convert a (type, value) parameter tuple like execute_stored_procedure does."""
+    value_type, actual_value = value
+    converters = {
+        "str": str,
+        "int": int,
+        "float": float,
+        "datetime": parser.isoparse,
+        "json": lambda x: json.dumps(x, ensure_ascii=False)
+    }
+    return converters[value_type](actual_value) if value_type in converters else actual_value
+
+
+class StatusWriter:
+    """Writes status updates in a background thread, so the caller does not wait for the database.
+
+    Updates are written in batches of up to config.STATUS_WRITER_BATCH_SIZE. Within a batch, only
+    the latest update of each form_id is written, in the order the forms were first seen, so the
+    updates of a form are never reordered. Pending updates are written when the writer is closed.
+    """
+
+    def __init__(self, executor, stored_procedure: str = STATUS_PROCEDURE):
+        """
+        Args:
+            executor: Callable taking the stored procedure name and a list of parameter dicts.
+            stored_procedure: The stored procedure to execute.
+        """
+        self.executor = executor
+        self.stored_procedure = stored_procedure
+        self.written = 0
+        self.coalesced = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="status_writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, params: dict) -> None:
+        """Queue a status update. params is the dict passed to journalizing.sp_update_status."""
+        self._queue.put(params)
+
+    def close(self) -> None:
+        """Write all pending updates and stop the writer."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if hasattr(self.executor, "close"):
+            self.executor.close()
+
+    def _run(self):
+        """Collect updates into batches and write them until the writer is closed.
+
+        A batch is written when it is full, config.STATUS_WRITER_FLUSH_SECONDS after its first update,
+        or when the writer is closed.
+        """
+        closing = False
+        while not closing:
+            batch = {}
+            item = self._queue.get()
+            flush_at = time.monotonic() + config.STATUS_WRITER_FLUSH_SECONDS
+
+            while item is not _CLOSE:
+                self._add(batch, item)
+                if len(batch) >= config.STATUS_WRITER_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+                except queue.Empty:
+                    break
+            else:
+                closing = True
+
+            if batch:
+                self._write(list(batch.values()))
+
+    def _add(self, batch: dict, params: dict):
+        """Add an update to the batch, replacing an earlier update of the same form."""
+        form_id = params["form_id"][1]
+        if form_id in batch:
+            self.coalesced += 1
+        batch[form_id] = params
+
+    def _write(self, batch: list[dict]):
+        try:
+            self.executor(self.stored_procedure, batch)
+            self.written += len(batch)
+        except BatchWriteError as e:
+            self.written += len(batch) - len(e.failed)
+            for params, error in e.failed:
+                print(f"Failed to write the status update of form {params['form_id'][1]}: {error}")
+        # The process must go on even if the status could not be written, like with execute_stored_procedure.
+        # pylint: disable-next = broad-exception-caught
+        except Exception as e:
+            print(f"Failed to write {len(batch)} status updates: {e}")
@@ -0,0 +1,14 @@
+"""Fixtures shared by the tests."""
+import pytest
+from OpenOrchestrator.database.queues import Base
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def engine():
+    """An in-memory SQLite database with the OpenOrchestrator tables, shared by all threads."""
+    sqlite_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(sqlite_engine)
+    yield sqlite_engine
+    sqlite_engine.dispose()
@@ -0,0 +1,41 @@
+"""Tests that streaming the submission sheet in chunks gives the same data as pd.read_excel."""
+import pandas as pd
+import pytest
+
+from robot_framework import config, initialize
+from robot_framework.benchmark.synthetic import synthetic_sheet
+
+
+@pytest.fixture(name="sheet_path")
+def fixture_sheet_path(tmp_path, monkeypatch):
+    """Point config.PATH at an empty folder for the sheets."""
+    monkeypatch.setattr(config, "PATH", str(tmp_path))
+    return tmp_path
+
+
+def read_streamed(filename: str, chunk_size: int) -> pd.DataFrame:
+    """Return the chunks of the sheet streamed like initialize does, joined to one frame."""
+    row_count, column_types = initialize.scan_excel(filename, chunk_size)
+    chunks = list(initialize.iter_excel_chunks(filename, chunk_size, column_types))
+    assert sum(len(chunk) for chunk in chunks) == row_count
+    return pd.concat(chunks, ignore_index=True)
+
+
+@pytest.mark.parametrize("chunk_size", [70, 300, 1000])
+def test_streamed_chunks_match_read_excel(sheet_path, chunk_size):
+    """The streamed columns have the values and types pd.read_excel gives, whatever the chunk size."""
+    synthetic_sheet(300, blob_size=10).to_excel(sheet_path / "sheet.xlsx", index=False)
+    loaded_df = initialize.load_excel_data("sheet.xlsx")
+
+    pd.testing.assert_frame_equal(read_streamed("sheet.xlsx", chunk_size), loaded_df[list(initialize.PROCESS_COLUMNS)])
+
+
+def test_blanks_in_one_chunk_type_the_whole_column(sheet_path):
+    """A blank in a later chunk makes a number column float in every chunk, like with pd.read_excel."""
+    sheet_df = synthetic_sheet(20)
+    sheet_df["cpr_nr"] = [1111111111] * 19 + [None]
+    sheet_df.to_excel(sheet_path / "sheet.xlsx", index=False)
+
+    streamed_df = read_streamed("sheet.xlsx", 10)
+    pd.testing.assert_series_equal(streamed_df["cpr_nr"], initialize.load_excel_data("sheet.xlsx")["cpr_nr"])
+    assert streamed_df["cpr_nr"].dtype == "float64"
@@ -0,0 +1,58 @@
+"""Tests of fetching a receipt from OS2FORMS with a fake server."""
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from robot_framework import config
+from robot_framework.cached_connection import CachedOrchestratorConnection
+from robot_framework.subprocesses import get_os2form_receipt
+
+
+class FakeConnection:
+    """Stands in for the OrchestratorConnection, counting the credential lookups."""
+
+    def __init__(self):
+        self.credential_lookups = 0
+
+    def get_credential(self, credential_name):
+        """Return a credential."""
+        self.credential_lookups += 1
+        return SimpleNamespace(username=credential_name, password="key")
+
+    def log_trace(self, message):
+        """Ignore the trace message."""
+
+
+@pytest.fixture(name="unauthorized")
+def fixture_unauthorized(tmp_path, monkeypatch):
+    """Answer every download with 401 Unauthorized, and return a queue element to fetch the receipt of."""
+    def get(url, **kwargs):
+        del kwargs
+        response = requests.Response()
+        response.status_code = 401
+        response.url = url
+        response.raw = io.BytesIO()
+        return response
+
+    monkeypatch.setattr(config, "PATH", str(tmp_path))
+    monkeypatch.setattr(config, "RECEIPT_CACHE_PATH", None)
+    monkeypatch.setattr(get_os2form_receipt.requests, "get", get)
+    return SimpleNamespace(data=json.dumps({"attachment": "https://os2forms.example/receipt", "uuid": "a", "filename": "sheet.xlsx"}))
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_an_authentication_failure_is_raised_as_a_network_error(unauthorized, cached):
+    """A 401 raises the network error whether or not the connection caches, and the cached key is dropped."""
+    connection = FakeConnection()
+    orchestrator_connection = CachedOrchestratorConnection(connection) if cached else connection
+    orchestrator_connection.get_credential(config.OS2_API_CREDENTIAL)
+
+    with pytest.raises(RuntimeError, match="Network error") as error:
+        get_os2form_receipt.fetch_receipt(unauthorized, "key", orchestrator_connection)
+    assert isinstance(error.value.__cause__, requests.HTTPError)
+
+    orchestrator_connection.get_credential(config.OS2_API_CREDENTIAL)
+    assert connection.credential_lookups == 2
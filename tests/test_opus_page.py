@@ -0,0 +1,63 @@
+"""Tests of tracking the current frame of the OPUS browser."""
+from types import SimpleNamespace
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from robot_framework.subprocesses import outlay_ticket_creation
+from robot_framework.subprocesses.opus_locators import FORM_FRAMES, PORTAL_FRAMES
+from robot_framework.subprocesses.outlay_ticket_creation import OpusPage
+
+
+class FakeBrowser:
+    """Keeps the path of frames it is in, failing to switch to the frames in missing_frames."""
+
+    def __init__(self, missing_frames=()):
+        self.missing_frames = set(missing_frames)
+        self.frames = ()
+        self.switch_to = SimpleNamespace(default_content=self.default_content)
+
+    def default_content(self):
+        """Switch to the top document."""
+        self.frames = ()
+
+    def switch_to_frame(self, frame):
+        """Switch to a frame of the current document, or time out if it is missing."""
+        if frame in self.missing_frames:
+            raise TimeoutException(f"frame {frame}")
+        self.frames += (frame,)
+
+
+@pytest.fixture(autouse=True)
+def fake_frames(monkeypatch):
+    """Switch the frames of the FakeBrowser instead of waiting for them in a real browser."""
+    monkeypatch.setattr(outlay_ticket_creation, "switch_to_frame", lambda browser, frame, timeout: browser.switch_to_frame(frame))
+
+
+def test_frames_are_only_switched_when_needed():
+    """The browser switches from the top document to the frame path, and not again when it is already there."""
+    browser = FakeBrowser()
+    page = OpusPage(browser)
+    page.switch_to(FORM_FRAMES)
+    assert browser.frames == FORM_FRAMES
+
+    browser.frames = ("changed behind the page's back",)
+    page.switch_to(FORM_FRAMES)
+    assert browser.frames == ("changed behind the page's back",)
+
+    page.switch_to(PORTAL_FRAMES)
+    assert browser.frames == PORTAL_FRAMES
+
+
+def test_a_frame_that_does_not_load_leaves_the_frame_unknown():
+    """If an inner frame times out, the next switch starts from the top document, wherever the browser was left."""
+    browser = FakeBrowser(missing_frames={FORM_FRAMES[-1]})
+    page = OpusPage(browser)
+
+    with pytest.raises(TimeoutException):
+        page.switch_to(FORM_FRAMES)
+    assert browser.frames == FORM_FRAMES[:-1]
+    assert page.frames is None
+
+    page.switch_to(PORTAL_FRAMES)
+    assert browser.frames == PORTAL_FRAMES
@@ -0,0 +1,117 @@
+"""Tests that initialize.process_data gives the same output as the row-by-row implementation it replaced."""
+import os
+
+import pandas as pd
+import pytest
+from cryptography.fernet import Fernet
+from mbu_dev_shared_components.utils.fernet_encryptor import Encryptor
+
+from robot_framework import config, initialize
+from robot_framework.benchmark.extract_months import extract_months_and_year_before
+from robot_framework.benchmark.synthetic import synthetic_sheet
+from robot_framework.subprocesses.cpr_encryption import decrypt_cpr_column
+
+if "OpenOrchestratorKey" not in os.environ:
+    os.environ["OpenOrchestratorKey"] = Fernet.generate_key().decode("utf-8")
+
+
+def process_data_before(df: pd.DataFrame, naeste_agent: str, filename) -> pd.DataFrame:
+    """The implementation before process_data was vectorized, building the output one row at a time."""
+    encryptor = Encryptor()
+    processed_data = []
+
+    for _, row in df.iterrows():
+        month_year = extract_months_and_year_before(row["test"])
+        cpr_nr = (
+            str(row["cpr_nr_paaanden"])
+            if not pd.isnull(row["cpr_nr_paaanden"])
+            else str(row["cpr_nr"])
+        )
+        url = initialize.extract_url_from_attachments(str(row.get("attachments", "")))
+        skoleliste = (
+            str(row["skoleliste"]).lower() if not pd.isnull(row["skoleliste"]) else ""
+        )
+
+        beloeb_value = (
+            row["aendret_beloeb_i_alt"]
+            if not pd.isnull(row["aendret_beloeb_i_alt"])
+            else row["beloeb_i_alt"]
+        )
+        if pd.notnull(beloeb_value):
+            beloeb_value = str(beloeb_value).replace(".", ",")
+            if beloeb_value.count(",") > 1:
+                parts = beloeb_value.split(",")
+                beloeb_value = "".join(parts[:-1]) + "," + parts[-1]
+
+        processed_data.append({
+            "filename": filename,
+            "cpr_encrypted": encryptor.encrypt(cpr_nr).decode("utf-8"),
+            "barnets_navn": str(row["barnets_navn"]),
+            "beloeb": beloeb_value,
+            "reference": month_year,
+            "arts_konto": "40430002",
+            "psp": determine_psp_value_before(skoleliste, row),
+            "posteringstekst": f"Egenbefordring {month_year}",
+            "naeste_agent": naeste_agent,
+            "attachment": url,
+            "uuid": row.get("uuid", pd.NA),
+            "godkendt_af": row.get("godkendt_af", pd.NA),
+            "skole": row["skriv_dit_barns_skole_eller_dagtilbud"]
+            if not pd.isnull(row["skriv_dit_barns_skole_eller_dagtilbud"])
+            else row["skoleliste"],
+            "is_godkendt": "x" in str(row.get("godkendt", "")).lower(),
+            "evt_kommentar": row.get("evt_kommentar"),
+        })
+
+    return pd.DataFrame(processed_data)
+
+
+def determine_psp_value_before(skoleliste: str, row: pd.Series) -> str:
+    """The PSP rules before they were moved to config.PSP_RULES."""
+    if "langagerskolen" in skoleliste or "751090#1830" in skoleliste or "751090#2471" in skoleliste:
+        return "XG-5240220808-00004"
+    if "stensagerskolen" in skoleliste or "751903#591" in skoleliste or "751903#2521" in skoleliste:
+        return "XG-5240220808-00005"
+    if not pd.isnull(row["skriv_dit_barns_skole_eller_dagtilbud"]):
+        return "XG-5240220808-00006"
+    return "XG-5240220808-00003"
+
+
+def assert_same_output(processed_df: pd.DataFrame, expected_df: pd.DataFrame):
+    """Assert the outputs are equal, comparing the CPR numbers decrypted since every encryption differs."""
+    processed_df = processed_df.assign(cpr_encrypted=decrypt_cpr_column(processed_df["cpr_encrypted"].tolist()))
+    expected_df = expected_df.assign(cpr_encrypted=decrypt_cpr_column(expected_df["cpr_encrypted"].tolist()))
+    pd.testing.assert_frame_equal(processed_df, expected_df)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_process_data_matches_row_by_row(seed):
+    """The vectorized process_data gives the same output as the row-by-row implementation."""
+    data_df = synthetic_sheet(300, seed)
+
+    assert_same_output(
+        initialize.process_data(data_df, "az00000", "sheet.xlsx"),
+        process_data_before(data_df, "az00000", "sheet.xlsx"),
+    )
+
+
+def test_process_data_matches_row_by_row_on_excel(tmp_path, monkeypatch):
+    """The outputs are also equal for a sheet read from Excel, with the column types pd.read_excel gives."""
+    monkeypatch.setattr(config, "PATH", str(tmp_path))
+    synthetic_sheet(300).to_excel(tmp_path / "sheet.xlsx", index=False)
+    data_df = initialize.load_excel_data("sheet.xlsx")
+
+    assert_same_output(
+        initialize.process_data(data_df, "az00000", "sheet.xlsx"),
+        process_data_before(data_df, "az00000", "sheet.xlsx"),
+    )
+
+
+def test_process_data_without_optional_columns():
+    """The columns read with row.get may be missing from the sheet."""
+    data_df = synthetic_sheet(50).drop(columns=["attachments", "uuid", "godkendt_af", "godkendt", "evt_kommentar"])
+
+    assert_same_output(
+        initialize.process_data(data_df, "az00000", "sheet.xlsx"),
+        process_data_before(data_df, "az00000", "sheet.xlsx"),
+    )
@@ -0,0 +1,129 @@
+"""Tests of claiming queue elements in batches under a lease, against SQLite."""
+from datetime import datetime, timedelta
+
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from robot_framework.queue_lease import QueueLeaseClaimer, get_new_queue_elements, get_queue_statuses
+
+QUEUE_NAME = "test_queue"
+
+
+def create_elements(engine, count: int, queue_name: str = QUEUE_NAME) -> None:
+    """Create count 'New' elements, referenced 0 to count - 1 in the order they were created."""
+    created = datetime.now() - timedelta(hours=1)
+    with Session(engine) as session, session.begin():
+        session.add_all(
+            QueueElement(queue_name=queue_name, reference=str(i), created_date=created + timedelta(seconds=i))
+            for i in range(count)
+        )
+
+
+def statuses(engine) -> dict[str, tuple]:
+    """Return the status and message of each element of the queue by its reference."""
+    with Session(engine) as session:
+        return {
+            element.reference: (element.status, element.message)
+            for element in session.scalars(select(QueueElement).where(QueueElement.queue_name == QUEUE_NAME))
+        }
+
+
+def age_leases(engine, seconds: int) -> None:
+    """Move the start of every 'In Progress' element seconds back in time."""
+    with Session(engine) as session, session.begin():
+        session.execute(
+            update(QueueElement)
+            .where(QueueElement.status == QueueStatus.IN_PROGRESS)
+            .values(start_date=datetime.now() - timedelta(seconds=seconds))
+        )
+
+
+def references(queue_elements) -> list[str]:
+    """Return the references of the queue elements."""
+    return [queue_element.reference for queue_element in queue_elements]
+
+
+def test_a_batch_is_claimed_oldest_first(engine):
+    """A batch of the oldest 'New' elements is claimed under the claimer's lease and handed out in order."""
+    create_elements(engine, 5)
+    create_elements(engine, 2, "another queue")
+    claimer = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=3, lease_seconds=600)
+
+    assert claimer.next().reference == "0"
+    current = statuses(engine)
+    assert all(current[reference] == (QueueStatus.IN_PROGRESS, claimer.lease_marker) for reference in ("0", "1", "2"))
+    assert current["3"] == current["4"] == (QueueStatus.NEW, None)
+
+    assert references(iter(claimer.next, None)) == ["1", "2", "3", "4"]
+
+
+def test_two_claimers_never_claim_the_same_element(engine):
+    """Each element is claimed by one of two claimers."""
+    create_elements(engine, 7)
+    first = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+    second = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+
+    claimed = references(first.claim()) + references(second.claim()) + references(first.claim()) + references(second.claim())
+    assert sorted(claimed) == [str(i) for i in range(7)]
+
+
+def test_release_sets_the_unhanded_elements_back_to_new(engine):
+    """Releasing sets the claimed elements still in the buffer back to 'New', but not the ones handed out."""
+    create_elements(engine, 4)
+    claimer = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=4, lease_seconds=600)
+    claimer.next()
+
+    assert claimer.release() == 3
+    current = statuses(engine)
+    assert current["0"] == (QueueStatus.IN_PROGRESS, claimer.lease_marker)
+    assert all(current[reference] == (QueueStatus.NEW, None) for reference in ("1", "2", "3"))
+    assert claimer.release() == 0
+
+
+def test_an_expired_lease_is_taken_over(engine):
+    """Elements whose lease is older than lease_seconds are claimed by another claimer."""
+    create_elements(engine, 2)
+    stopped = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+    stopped.claim()
+    other = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+
+    assert not other.claim()
+    age_leases(engine, 601)
+    assert references(other.claim()) == ["0", "1"]
+    assert statuses(engine)["0"] == (QueueStatus.IN_PROGRESS, other.lease_marker)
+
+
+def test_an_element_being_processed_is_not_taken_over(engine):
+    """The 'Processing' message replaces the lease, so the element is never claimed again."""
+    create_elements(engine, 2)
+    claimer = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+    queue_element = claimer.next()
+    with Session(engine) as session, session.begin():
+        session.execute(update(QueueElement).where(QueueElement.id == queue_element.id).values(message="Processing"))
+    claimer.release()
+    age_leases(engine, 601)
+
+    other = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+    assert references(other.claim()) == ["1"]
+    assert statuses(engine)["0"] == (QueueStatus.IN_PROGRESS, "Processing")
+
+
+def test_a_half_expired_lease_is_released_before_handing_out(engine):
+    """Elements are not handed out once half the lease has passed, since another robot may soon take them over."""
+    create_elements(engine, 3)
+    claimer = QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=2, lease_seconds=600)
+    claimer.next()
+    claimer._lease_start -= timedelta(seconds=301)  # pylint: disable=protected-access
+
+    assert claimer.next().reference == "1"
+    assert statuses(engine)["2"] == (QueueStatus.IN_PROGRESS, claimer.lease_marker)
+
+
+def test_lookups_do_not_claim(engine):
+    """get_new_queue_elements and get_queue_statuses leave the queue as it is."""
+    create_elements(engine, 3)
+    QueueLeaseClaimer(engine, QUEUE_NAME, batch_size=1, lease_seconds=600).claim()
+
+    assert references(get_new_queue_elements(engine, QUEUE_NAME, 5)) == ["1", "2"]
+    assert get_queue_statuses(engine, QUEUE_NAME, ["0", "2", "missing"]) == {"0": QueueStatus.IN_PROGRESS, "2": QueueStatus.NEW}
@@ -0,0 +1,113 @@
+"""Tests of prefetching receipts with a fake claim and fetch."""
+import threading
+from types import SimpleNamespace
+
+import pytest
+from OpenOrchestrator.database.queues import QueueStatus
+
+from robot_framework.subprocesses.receipt_prefetch import ReceiptPrefetcher
+
+
+class FakeConnection:
+    """Stands in for the OrchestratorConnection, keeping the status changes."""
+
+    def __init__(self):
+        self.statuses = []
+
+    def set_queue_element_status(self, element_id, status):
+        """Keep the status change."""
+        self.statuses.append((element_id, status))
+
+    def log_trace(self, message):
+        """Ignore the trace message."""
+
+
+class FakeQueue:
+    """Claims the elements of ids in order, raising the exceptions among them once."""
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.lock = threading.Lock()
+
+    def next_queue_element(self):
+        """Return the next element, or None if the queue is empty."""
+        with self.lock:
+            if not self.ids:
+                return None
+            element_id = self.ids.pop(0)
+        if isinstance(element_id, Exception):
+            raise element_id
+        return SimpleNamespace(id=element_id)
+
+    def remaining(self) -> int:
+        """Return the number of elements not claimed."""
+        with self.lock:
+            return len(self.ids)
+
+
+def fetch(queue_element) -> str:
+    """Return the folder of the receipt, failing for the element with id 'bad'."""
+    if queue_element.id == "bad":
+        raise ConnectionError("download failed")
+    return f"receipts/{queue_element.id}"
+
+
+def handed_out(prefetcher: ReceiptPrefetcher) -> list:
+    """Return the ids and receipt folders of all elements handed out by the prefetcher until the queue is empty."""
+    results = []
+    while (item := prefetcher.next()) is not None:
+        queue_element, receipt = item
+        results.append((queue_element.id, receipt.result()))
+    return results
+
+
+def test_elements_are_handed_out_in_claim_order():
+    """Each element comes with its receipt, in the order the elements were claimed, and then None on every call."""
+    prefetcher = ReceiptPrefetcher(FakeConnection(), FakeQueue(range(10)).next_queue_element, fetch, lookahead=3)
+    prefetcher.start()
+
+    assert handed_out(prefetcher) == [(i, f"receipts/{i}") for i in range(10)]
+    assert prefetcher.next() is None
+    prefetcher.close()
+
+
+def test_a_failed_download_is_raised_from_the_future():
+    """A failed download doesn't stop the prefetching, but is raised when the receipt of its element is used."""
+    prefetcher = ReceiptPrefetcher(FakeConnection(), FakeQueue([1, "bad", 2]).next_queue_element, fetch, lookahead=3)
+    prefetcher.start()
+
+    assert prefetcher.next()[0].id == 1
+    queue_element, receipt = prefetcher.next()
+    assert queue_element.id == "bad"
+    with pytest.raises(ConnectionError, match="download failed"):
+        receipt.result()
+    assert prefetcher.next()[0].id == 2
+    assert prefetcher.next() is None
+    prefetcher.close()
+
+
+def test_a_failed_claim_is_raised_once_and_claiming_starts_again():
+    """An error claiming is raised by next, and the following call claims the remaining elements."""
+    prefetcher = ReceiptPrefetcher(FakeConnection(), FakeQueue([1, RuntimeError("database down"), 2, 3]).next_queue_element, fetch, lookahead=3)
+    prefetcher.start()
+
+    assert prefetcher.next()[0].id == 1
+    with pytest.raises(RuntimeError, match="database down"):
+        prefetcher.next()
+    assert handed_out(prefetcher) == [(2, "receipts/2"), (3, "receipts/3")]
+    prefetcher.close()
+
+
+def test_elements_not_handed_out_are_released_on_close():
+    """The claimed elements waiting in the buffer are set back to 'New' on close, and no more are claimed."""
+    connection = FakeConnection()
+    fake_queue = FakeQueue(range(10))
+    prefetcher = ReceiptPrefetcher(connection, fake_queue.next_queue_element, fetch, lookahead=3)
+    prefetcher.start()
+
+    assert prefetcher.next()[0].id == 0
+    prefetcher.close()
+
+    claimed = 10 - fake_queue.remaining()
+    assert connection.statuses == [(i, QueueStatus.NEW) for i in range(1, claimed)]
+    assert claimed - 1 >= 3
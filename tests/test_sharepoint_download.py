@@ -0,0 +1,68 @@
+"""Tests of downloading the submission sheets from SharePoint with a fake client."""
+import os
+
+from robot_framework.subprocesses.sharepoint_download import MANIFEST_FILENAME, download_files
+
+
+class FakeFolderClient:
+    """Stands in for SharepointFolderClient, serving the files of a dict and counting the downloads."""
+
+    def __init__(self, files: dict[str, bytes], downloads: list[str]):
+        self.files = files
+        self.downloads = downloads
+
+    def list_files(self, folder_name: str) -> list[dict]:
+        """List the files with metadata that changes with their content."""
+        del folder_name
+        return [
+            {"Name": name, "ServerRelativeUrl": f"/folder/{name}", "Length": len(content),
+             "TimeLastModified": "2024-01-01", "ETag": str(hash(content))}
+            for name, content in self.files.items()
+        ]
+
+    def download_file(self, file_info: dict, file_object) -> None:
+        """Write the content of the file."""
+        self.downloads.append(file_info["Name"])
+        file_object.write(self.files[file_info["Name"]])
+
+
+def client_factory(files: dict[str, bytes], downloads: list[str]):
+    """Return a client_factory for download_files serving files."""
+    return lambda: FakeFolderClient(files, downloads)
+
+
+def test_unchanged_files_are_not_downloaded_again(tmp_path):
+    """Only new and changed files are downloaded, and every matching file is returned."""
+    files = {"a.xlsx": b"a", "b.xlsx": b"b", "notes.txt": b"n"}
+    downloads = []
+
+    assert sorted(download_files("folder", str(tmp_path), client_factory(files, downloads))) == ["a.xlsx", "b.xlsx"]
+    assert sorted(downloads) == ["a.xlsx", "b.xlsx"]
+
+    files["b.xlsx"] = b"changed"
+    downloads.clear()
+    assert sorted(download_files("folder", str(tmp_path), client_factory(files, downloads))) == ["a.xlsx", "b.xlsx"]
+    assert downloads == ["b.xlsx"]
+    assert (tmp_path / "b.xlsx").read_bytes() == b"changed"
+
+
+def test_removed_files_are_deleted(tmp_path):
+    """A file that is no longer in the SharePoint folder is deleted locally."""
+    files = {"a.xlsx": b"a", "b.xlsx": b"b"}
+    download_files("folder", str(tmp_path), client_factory(files, []))
+
+    del files["a.xlsx"]
+    assert download_files("folder", str(tmp_path), client_factory(files, [])) == ["b.xlsx"]
+    assert not (tmp_path / "a.xlsx").exists()
+    assert (tmp_path / "b.xlsx").exists()
+
+
+def test_removed_files_are_deleted_when_the_folder_is_empty(tmp_path):
+    """The local copies are deleted even when no file is left to download, since the sheets hold CPR numbers."""
+    files = {"a.xlsx": b"a"}
+    download_files("folder", str(tmp_path), client_factory(files, []))
+
+    files.clear()
+    assert not download_files("folder", str(tmp_path), client_factory(files, []))
+    assert os.listdir(tmp_path) == [MANIFEST_FILENAME]
+    assert (tmp_path / MANIFEST_FILENAME).read_text(encoding="utf-8").strip() == "{}"
@@ -0,0 +1,184 @@
+"""Tests of writing the status updates in the background with a fake executor."""
+import threading
+import time
+
+import pytest
+
+from robot_framework import config
+from robot_framework.subprocesses import status_writer
+from robot_framework.subprocesses.status_writer import BatchWriteError, PooledProcedureExecutor, StatusWriter
+
+
+class FakeExecutor:
+    """Keeps the batches it is called with, and the time of each call."""
+
+    def __init__(self, fail_forms=()):
+        self.fail_forms = set(fail_forms)
+        self.batches = []
+        self.times = []
+        self.called = threading.Event()
+        self.closed = False
+
+    def __call__(self, stored_procedure, batch):
+        self.batches.append([(params["form_id"][1], params["status"][1]) for params in batch])
+        self.times.append(time.monotonic())
+        self.called.set()
+        failed = [(params, ValueError("rejected")) for params in batch if params["form_id"][1] in self.fail_forms]
+        if failed:
+            raise BatchWriteError(failed)
+
+    def close(self):
+        """Keep that the writer closed the executor."""
+        self.closed = True
+
+
+def update(form_id: str, status: str) -> dict:
+    """Return the parameters of a status update."""
+    return {"form_id": ("str", form_id), "status": ("str", status)}
+
+
+@pytest.fixture
+def slow_flush(monkeypatch):
+    """Make batches wait long for more updates, so they are only written when full or closed."""
+    monkeypatch.setattr(config, "STATUS_WRITER_FLUSH_SECONDS", 60)
+    monkeypatch.setattr(config, "STATUS_WRITER_BATCH_SIZE", 50)
+
+
+@pytest.mark.usefixtures("slow_flush")
+def test_the_latest_update_of_each_form_is_written_in_first_seen_order():
+    """Within a batch only the latest update of a form is written, in the order the forms were first seen."""
+    executor = FakeExecutor()
+    writer = StatusWriter(executor)
+    for params in (update("a", "1"), update("b", "1"), update("a", "2"), update("c", "1"), update("b", "2")):
+        writer.submit(params)
+    writer.close()
+
+    assert executor.batches == [[("a", "2"), ("b", "2"), ("c", "1")]]
+    assert (writer.written, writer.coalesced) == (3, 2)
+
+
+@pytest.mark.usefixtures("slow_flush")
+def test_close_writes_the_pending_updates_at_once():
+    """Closing doesn't wait for the flush window."""
+    executor = FakeExecutor()
+    writer = StatusWriter(executor)
+    writer.submit(update("a", "1"))
+
+    start = time.monotonic()
+    writer.close()
+    assert time.monotonic() - start < 5
+    assert executor.batches == [[("a", "1")]]
+    assert executor.closed
+
+
+@pytest.mark.usefixtures("slow_flush")
+def test_a_full_batch_is_written_at_once(monkeypatch):
+    """A batch of STATUS_WRITER_BATCH_SIZE forms is written without waiting for the flush window."""
+    monkeypatch.setattr(config, "STATUS_WRITER_BATCH_SIZE", 2)
+    executor = FakeExecutor()
+    writer = StatusWriter(executor)
+    for form_id in "abc":
+        writer.submit(update(form_id, "1"))
+
+    assert executor.called.wait(5)
+    writer.close()
+    assert executor.batches == [[("a", "1"), ("b", "1")], [("c", "1")]]
+
+
+def test_a_batch_is_written_after_the_flush_window(monkeypatch):
+    """The updates arriving within STATUS_WRITER_FLUSH_SECONDS of the first are written together, when the window ends."""
+    monkeypatch.setattr(config, "STATUS_WRITER_FLUSH_SECONDS", 0.5)
+    executor = FakeExecutor()
+    writer = StatusWriter(executor)
+
+    start = time.monotonic()
+    writer.submit(update("a", "1"))
+    time.sleep(0.1)
+    writer.submit(update("b", "1"))
+    assert executor.called.wait(5)
+    writer.close()
+
+    assert executor.batches == [[("a", "1"), ("b", "1")]]
+    assert executor.times[0] - start >= 0.5
+
+
+@pytest.mark.usefixtures("slow_flush")
+def test_failed_updates_are_not_counted_as_written():
+    """When some updates of a batch fail, the rest are counted as written."""
+    executor = FakeExecutor(fail_forms={"b"})
+    writer = StatusWriter(executor)
+    for form_id in "abc":
+        writer.submit(update(form_id, "1"))
+    writer.close()
+
+    assert writer.written == 2
+
+
+class FakeDatabase:
+    """Stands in for pyodbc, rejecting the updates of some forms and keeping the committed updates."""
+
+    def __init__(self, fail_forms=()):
+        self.fail_forms = set(fail_forms)
+        self.committed = []
+        self.connections = 0
+
+    def connect(self, connection_string):
+        """Open a connection."""
+        del connection_string
+        self.connections += 1
+        return FakeDatabaseConnection(self)
+
+    def rejects(self, form_id: str) -> bool:
+        """Check if the update of the form is rejected."""
+        return form_id in self.fail_forms
+
+
+class FakeDatabaseConnection:
+    """A connection to FakeDatabase, committing the executed updates together."""
+
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.pending = []
+
+    def cursor(self):
+        """Return the connection as its own cursor."""
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, values):
+        """Execute a call of the stored procedure, failing for the rejected forms."""
+        del sql
+        if self.database.rejects(values[0]):
+            raise status_writer.pyodbc.Error("rejected")
+        self.pending.append(values[0])
+
+    def commit(self):
+        """Commit the executed calls."""
+        self.database.committed.extend(self.pending)
+        self.pending = []
+
+    def close(self):
+        """Drop the calls that were not committed."""
+        self.pending = []
+
+
+def test_a_rejected_update_does_not_keep_the_rest_of_the_batch_from_being_written(monkeypatch):
+    """The batch is retried one update at a time, and only the rejected update is raised."""
+    database = FakeDatabase(fail_forms={"b"})
+    monkeypatch.setattr(status_writer.pyodbc, "connect", database.connect, raising=False)
+    executor = PooledProcedureExecutor("connection string")
+
+    with pytest.raises(BatchWriteError) as error:
+        executor(status_writer.STATUS_PROCEDURE, [update("a", "1"), update("b", "1"), update("c", "1")])
+
+    assert database.committed == ["a", "c"]
+    assert [params["form_id"][1] for params, _ in error.value.failed] == ["b"]
+
+    executor(status_writer.STATUS_PROCEDURE, [update("d", "1")])
+    assert database.committed == ["a", "c", "d"]
+    assert database.connections == 3  # Connected again after the failed batch and the failed update
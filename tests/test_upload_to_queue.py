@@ -0,0 +1,76 @@
+"""Tests of uploading the processed rows to the queue, skipping the forms already in it."""
+import json
+
+import pandas as pd
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from robot_framework import config, initialize
+
+
+class FakeConnection:
+    """Stands in for the OrchestratorConnection, inserting queue elements in the database of engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.batches = []
+
+    def bulk_create_queue_elements(self, queue_name, references, data):
+        """Insert the queue elements like OpenOrchestrator does."""
+        self.batches.append(len(references))
+        with Session(self.engine) as session, session.begin():
+            session.execute(insert(QueueElement), [
+                {"queue_name": queue_name, "reference": reference, "data": element_data}
+                for reference, element_data in zip(references, data)
+            ])
+
+    def log_trace(self, message):
+        """Ignore the trace message."""
+
+
+def processed_rows(form_uuids) -> pd.DataFrame:
+    """Return processed rows of the given form uuids."""
+    return pd.DataFrame({
+        "uuid": form_uuids,
+        "posteringstekst": ["Egenbefordring Januar 2024"] * len(form_uuids),
+        "is_godkendt": [True] * len(form_uuids),
+    })
+
+
+def queued(engine) -> dict[str, QueueElement]:
+    """Return the elements of the queue by their reference."""
+    with Session(engine) as session:
+        return {element.reference: element for element in session.scalars(select(QueueElement).where(QueueElement.queue_name == config.QUEUE_NAME))}
+
+
+def test_the_form_uuid_is_the_reference(engine):
+    """Each row is queued with its form uuid as reference and the row as data."""
+    initialize.upload_to_queue(processed_rows(["a", "b"]), FakeConnection(engine), engine)
+
+    elements = queued(engine)
+    assert sorted(elements) == ["a", "b"]
+    assert json.loads(elements["a"].data)["uuid"] == "a"
+
+
+def test_forms_already_in_the_queue_are_skipped(engine, monkeypatch):
+    """Rows already in the queue, whatever their status, are skipped, and the rest are inserted in batches."""
+    monkeypatch.setattr(config, "QUEUE_BATCH_SIZE", 2)
+    connection = FakeConnection(engine)
+    initialize.upload_to_queue(processed_rows(["a", "b"]), connection, engine)
+    with Session(engine) as session, session.begin():
+        session.execute(update(QueueElement).where(QueueElement.reference == "a").values(status=QueueStatus.DONE))
+    connection.batches.clear()
+
+    new_form_uuids = set()
+    assert initialize.upload_to_queue(processed_rows(["a", "b", "c", "d", "e"]), connection, engine, new_form_uuids) == (3, 2)
+    assert connection.batches == [2, 1]
+    assert sorted(queued(engine)) == ["a", "b", "c", "d", "e"]
+    assert new_form_uuids == {"b", "c", "d", "e"}
+
+
+def test_other_queues_are_ignored(engine):
+    """A form in another queue is not skipped."""
+    FakeConnection(engine).bulk_create_queue_elements("another queue", ["a"], ["{}"])
+
+    assert initialize.upload_to_queue(processed_rows(["a"]), FakeConnection(engine), engine) == (1, 0)